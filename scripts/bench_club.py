@@ -0,0 +1,93 @@
+"""
+Benchmark del Wrapped de club amb membres sintètics (sense Strava ni HTTP).
+
+Per a cada mida de club es mesura la reconstrucció sencera de l'agregat, la
+lectura de les stats formatades i l'actualització incremental quan un membre
+canvia. La reconstrucció hauria de créixer linealment i l'actualització ser
+constant.
+
+    python scripts/bench_club.py --members 1000,2500,5000,10000
+"""
+import argparse
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src import club_stats  # noqa: E402
+from src.state_store import get_store  # noqa: E402
+
+SPORTS = ["Run", "Ride", "TrailRun", "Walk", "Hike", "Swim", "GravelRide", "WeightTraining", "Yoga"]
+
+
+def synthetic_summary(rng: random.Random) -> dict:
+    """Resum amb la forma de strava_client.summarize_activities."""
+    activities = rng.randint(20, 300)
+    return {
+        "total_distance": rng.uniform(1e5, 1e7),
+        "total_time": rng.randint(10_000, 1_000_000),
+        "total_elevation": rng.uniform(0, 100_000),
+        "total_watt_seconds": rng.uniform(0, 1e9),
+        "total_kudos": rng.randint(0, 5000),
+        "total_photos": rng.randint(0, 500),
+        "total_comments": rng.randint(0, 500),
+        "total_athlets": rng.randint(activities, activities * 4),
+        "total_prs": rng.randint(0, 300),
+        "sports_counter": {s: rng.randint(1, 100) for s in rng.sample(SPORTS, rng.randint(1, 4))},
+        "hour_counter": {"morning": rng.randint(0, 100), "afternoon": rng.randint(0, 100), "night": rng.randint(0, 50)},
+        "most_kudos_activity": {"name": f"Activitat {rng.randint(0, 10**6)}", "kudos": rng.randint(0, 200)},
+        "total_activities": activities,
+    }
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def bench(size: int, updates: int, seed: int):
+    rng = random.Random(seed)
+    club_id = f"bench-{size}"
+    store = get_store()
+    first_id = size * 1_000_000
+    members = list(range(first_id, first_id + size))
+
+    for athlete_id in members:
+        store.set(f"{club_stats.SUMMARY_PREFIX}{athlete_id}", synthetic_summary(rng))
+        store.set(f"{club_stats.ATHLETE_CLUBS_PREFIX}{athlete_id}", [club_id])
+    store.set(f"{club_stats.CLUB_PREFIX}{club_id}", {"club_id": club_id, "name": club_id, "members": members})
+
+    rebuild_s, _ = timed(club_stats.rebuild_aggregate, club_id)
+    read_s, stats = timed(club_stats.get_club_wrapped_stats, club_id)
+
+    update_times = []
+    for athlete_id in rng.sample(members, min(updates, size)):
+        elapsed, _ = timed(club_stats.save_member_summary, athlete_id, synthetic_summary(rng))
+        update_times.append(elapsed)
+    return rebuild_s, read_s, update_times, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--members", default="1000,2500,5000,10000", help="mides de club separades per comes")
+    parser.add_argument("--updates", type=int, default=200, help="actualitzacions incrementals per mida")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print(f"{'membres':>8} {'rebuild ms':>11} {'µs/membre':>10} {'lectura ms':>11} {'update p50 ms':>14} {'update p99 ms':>14}")
+    for size in (int(x) for x in args.members.split(",")):
+        rebuild_s, read_s, updates, stats = bench(size, args.updates, args.seed)
+        ordered = sorted(updates)
+        p99 = ordered[min(len(ordered) - 1, round(0.99 * (len(ordered) - 1)))]
+        print(f"{size:>8} {rebuild_s * 1000:>11.1f} {rebuild_s / size * 1e6:>10.2f} {read_s * 1000:>11.2f} "
+              f"{statistics.median(updates) * 1000:>14.3f} {p99 * 1000:>14.3f}")
+    print(f"exemple ({size} membres): {stats['total_distance_km']}, {stats['activities_last_year']}, "
+          f"podi {stats['sport_podium']['first']}")
+
+
+if __name__ == "__main__":
+    main()
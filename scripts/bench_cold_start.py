@@ -0,0 +1,78 @@
+"""
+Benchmark d'arrencada en fred.
+
+Arrenca `uvicorn src.main:app` com a procés nou i mesura, des del moment del
+spawn, el temps fins al primer byte de /auth i fins que /ready retorna 200.
+
+    python scripts/bench_cold_start.py --runs 5
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+
+def _first_byte(url: str, timeout: float = 2) -> bool:
+    class NoRedirect(urllib.request.HTTPRedirectHandler):
+        def redirect_request(self, *args, **kwargs):
+            return None
+
+    opener = urllib.request.build_opener(NoRedirect)
+    try:
+        with opener.open(url, timeout=timeout) as response:
+            response.read(1)
+            return True
+    except urllib.error.HTTPError as e:
+        # Una redirecció (/auth) o un 503 (/ready) també és un byte rebut
+        return e.code != 503
+    except (urllib.error.URLError, ConnectionError, OSError):
+        return False
+
+
+def _wait_for(url: str, start: float, deadline_s: float) -> float:
+    while time.perf_counter() - start < deadline_s:
+        if _first_byte(url):
+            return time.perf_counter() - start
+        time.sleep(0.01)
+    raise TimeoutError(f"{url} no ha respost en {deadline_s}s")
+
+
+def run_once(port: int, deadline_s: float):
+    base = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "src.main:app", "--port", str(port), "--log-level", "warning"],
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        ttfb = _wait_for(f"{base}/auth", start, deadline_s)
+        ready = _wait_for(f"{base}/ready", start, deadline_s)
+        return ttfb, ready
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--deadline", type=float, default=60)
+    args = parser.parse_args()
+
+    ttfbs, readies = [], []
+    for i in range(args.runs):
+        ttfb, ready = run_once(args.port, args.deadline)
+        ttfbs.append(ttfb)
+        readies.append(ready)
+        print(f"run {i + 1}: TTFB /auth {ttfb * 1000:.0f} ms, /ready {ready * 1000:.0f} ms")
+
+    print(f"mediana: TTFB /auth {statistics.median(ttfbs) * 1000:.0f} ms, "
+          f"/ready {statistics.median(readies) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
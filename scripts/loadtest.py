@@ -0,0 +1,103 @@
+"""
+Escenari de càrrega contra l'app apuntant al Strava fals (src/fake_strava.py).
+
+Cada usuari virtual fa: /exchange_token -> /me_token -> /wrapped -> /wrapped/image
+i al final es mostra el throughput i els percentils de latència per pas.
+
+    uvicorn src.fake_strava:app --port 9000 &
+    STRAVA_BASE_URL=http://localhost:9000 uvicorn src.main:app --port 8000 &
+    python scripts/loadtest.py --users 200 --concurrency 20
+"""
+import argparse
+import statistics
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+STEPS = ["exchange_token", "me_token", "wrapped", "wrapped/image"]
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[k]
+
+
+def run_user(base_url: str, athlete_id: int, timeout: float):
+    """Executa l'escenari per un atleta. Retorna [(pas, segons, ok)]."""
+    results = []
+    session = requests.Session()
+
+    def step(name, fn):
+        start = time.perf_counter()
+        try:
+            response = fn()
+            ok = response.status_code < 400
+        except requests.RequestException:
+            response, ok = None, False
+        results.append((name, time.perf_counter() - start, ok))
+        return response if ok else None
+
+    response = step("exchange_token", lambda: session.get(
+        f"{base_url}/exchange_token", params={"code": f"fake-{athlete_id}"},
+        allow_redirects=False, timeout=timeout))
+    if response is None:
+        return results
+    token = parse_qs(urlparse(response.headers.get("location", "")).query).get("token", [None])[0]
+    if not token:
+        results[-1] = ("exchange_token", results[-1][1], False)
+        return results
+
+    headers = {"x-session-token": token}
+    for name in STEPS[1:]:
+        if step(name, lambda: session.get(f"{base_url}/{name}", headers=headers, timeout=timeout)) is None:
+            break
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--users", type=int, default=100, help="usuaris virtuals (escenaris) en total")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--first-athlete-id", type=int, default=1000)
+    parser.add_argument("--timeout", type=float, default=120)
+    args = parser.parse_args()
+
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    completed = 0
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        futures = [pool.submit(run_user, args.base_url, args.first_athlete_id + i, args.timeout)
+                   for i in range(args.users)]
+        for future in as_completed(futures):
+            results = future.result()
+            for name, elapsed, ok in results:
+                if ok:
+                    latencies[name].append(elapsed)
+                else:
+                    errors[name] += 1
+            if len(results) == len(STEPS) and all(ok for _, _, ok in results):
+                completed += 1
+    wall = time.perf_counter() - start
+
+    print(f"\n{args.users} usuaris, concurrència {args.concurrency}, {wall:.1f}s")
+    print(f"throughput: {completed / wall:.2f} escenaris/s ({completed} complets)\n")
+    print(f"{'pas':<16}{'n':>6}{'err':>6}{'mitjana':>10}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for name in STEPS:
+        values = latencies[name]
+        mean = statistics.mean(values) if values else 0.0
+        print(f"{name:<16}{len(values):>6}{errors[name]:>6}"
+              f"{mean * 1000:>9.0f}ms{percentile(values, 50) * 1000:>8.0f}ms"
+              f"{percentile(values, 95) * 1000:>8.0f}ms{percentile(values, 99) * 1000:>8.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Optional
+
+from src import strava_client
+
+# Consulta d'activitats per a /activities: filtre per dates i esport,
+# paginació i projecció de camps. Si la finestra cau dins de l'últim any es
+# serveix de les activitats locals (cache); si no, es demana la pàgina a Strava.
+# Amb format=ndjson no es pagina: surt tot el conjunt filtrat, en streaming
+# (les locals sense el límit de MAX_PER_PAGE, les de Strava pàgina a pàgina).
+
+MAX_PER_PAGE = 200
+STRAVA_PAGE = strava_client.PER_PAGE  # pàgines de Strava en streaming
+# Per defecte no enviem el mapa: la polilínia és la major part del pes i la llista no la fa servir
+DEFAULT_EXCLUDED_FIELDS = {"map"}
+
+
+class ActivitiesUnavailable(Exception):
+    pass
+
+
+def parse_time(value: Optional[str]) -> Optional[int]:
+    """Accept an epoch timestamp or an ISO date/datetime and return epoch seconds."""
+    if value is None or value == "":
+        return None
+    if value.isdigit():
+        return int(value)
+    dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp())
+
+
+def parse_list(value: Optional[str]) -> Optional[set]:
+    if not value:
+        return None
+    return {item.strip() for item in value.split(",") if item.strip()}
+
+
+def _start_ts(activity: dict) -> float:
+    try:
+        return datetime.fromisoformat(activity["start_date"].replace("Z", "+00:00")).timestamp()
+    except (KeyError, ValueError):
+        return 0
+
+
+def project(activity: dict, fields: Optional[set]) -> dict:
+    if fields is None:
+        return {k: v for k, v in activity.items() if k not in DEFAULT_EXCLUDED_FIELDS}
+    if "*" in fields:
+        return activity
+    return {k: activity[k] for k in fields if k in activity}
+
+
+def _matches(activity: dict, after, before, sport_types) -> bool:
+    if sport_types and activity.get("sport_type") not in sport_types:
+        return False
+    if after is not None or before is not None:
+        ts = _start_ts(activity)
+        if after is not None and ts <= after:
+            return False
+        if before is not None and ts >= before:
+            return False
+    return True
+
+
+def _last_year_window(after, before):
+    one_year_ago = int((datetime.now(timezone.utc) - timedelta(days=365)).timestamp())
+    if after is None and before is None:
+        after = one_year_ago
+    return after, after is not None and after >= one_year_ago
+
+
+def _local_matching(athlete_id: int, after, before, sport_types) -> list:
+    activities = strava_client.get_activities_for_last_year(athlete_id)
+    if activities is None:
+        raise ActivitiesUnavailable("Could not fetch activities from Strava")
+    matching = [a for a in activities if _matches(a, after, before, sport_types)]
+    matching.sort(key=_start_ts, reverse=True)
+    return matching
+
+
+def query_activities(athlete_id: int, after: int = None, before: int = None,
+                     sport_types: set = None, page: int = 1, per_page: int = 30,
+                     fields: set = None) -> dict:
+    """
+    Return {"items", "total", "source"}. Without a date range the window is the
+    last year (the scope of the app). "total" is None when paging through Strava.
+    """
+    page = max(page, 1)
+    per_page = max(1, min(per_page, MAX_PER_PAGE))
+    after, local = _last_year_window(after, before)
+
+    if local:
+        matching = _local_matching(athlete_id, after, before, sport_types)
+        offset = (page - 1) * per_page
+        items = [project(a, fields) for a in matching[offset:offset + per_page]]
+        return {"items": items, "total": len(matching), "source": "local"}
+
+    # Fora de l'últim any: pàgina de Strava, filtrada després (pot tornar menys de per_page)
+    activities = strava_client.get_activities_page(athlete_id, page, per_page, after, before)
+    items = [project(a, fields) for a in activities if _matches(a, None, None, sport_types)]
+    return {"items": items, "total": None, "source": "strava"}
+
+
+def stream_activities(athlete_id: int, after: int = None, before: int = None,
+                      sport_types: set = None, fields: set = None) -> dict:
+    """
+    Like query_activities but unpaged: "items" is an iterator over the whole
+    filtered set. The first Strava page is fetched here, so errors surface
+    before the response starts; the rest are fetched as the stream is read.
+    """
+    after, local = _last_year_window(after, before)
+    if local:
+        matching = _local_matching(athlete_id, after, before, sport_types)
+        return {"items": (project(a, fields) for a in matching), "total": len(matching), "source": "local"}
+
+    first = strava_client.get_activities_page(athlete_id, 1, STRAVA_PAGE, after, before)
+    items = (project(a, fields) for a in _strava_pages(athlete_id, first, after, before)
+             if _matches(a, None, None, sport_types))
+    return {"items": items, "total": None, "source": "strava"}
+
+
+def _strava_pages(athlete_id: int, batch: list, after, before):
+    page = 1
+    while True:
+        yield from batch
+        if len(batch) < STRAVA_PAGE:
+            return
+        page += 1
+        batch = strava_client.get_activities_page(athlete_id, page, STRAVA_PAGE, after, before)
+
+
+def iter_ndjson(items: Iterable[dict], chunk_size: int = 100):
+    """NDJSON in chunks of lines, so big lists stream without one huge string."""
+    chunk = []
+    for item in items:
+        chunk.append(json.dumps(item))
+        if len(chunk) >= chunk_size:
+            yield "\n".join(chunk) + "\n"
+            chunk = []
+    if chunk:
+        yield "\n".join(chunk) + "\n"
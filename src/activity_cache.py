@@ -0,0 +1,30 @@
+import time
+from typing import Optional
+
+from src import config
+from src.state_store import get_store
+
+# Activitats de l'últim any per athlete, guardades a l'store compartit.
+# Les omple get_activities_for_last_year i les reaprofiten /wrapped i /activities
+# sense tornar a demanar-les a Strava mentre no caduquin.
+
+PREFIX = "activities:"
+
+
+def save_activities(athlete_id: int, activities: list, after: int, ttl: int = None, source: str = "strava"):
+    get_store().set(
+        f"{PREFIX}{athlete_id}",
+        {"fetched_at": time.time(), "after": after, "source": source, "activities": activities},
+        ttl=ttl or config.ACTIVITY_CACHE_TTL,
+    )
+
+
+def load_activities(athlete_id: int) -> Optional[dict]:
+    """Return {"fetched_at", "after", "source", "activities"} or None."""
+    if athlete_id is None:
+        return None
+    return get_store().get(f"{PREFIX}{athlete_id}")
+
+
+def invalidate(athlete_id: int):
+    get_store().delete(f"{PREFIX}{athlete_id}")
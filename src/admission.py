@@ -0,0 +1,107 @@
+import asyncio
+import contextvars
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src import config
+from src.metrics import Counter, Gauge
+from src.profiling import current_profile, profiled
+
+# Control d'admissió per etapa (fetch de Strava, render). Cada etapa té un
+# nombre màxim de tasques en curs i una cua d'espera acotada; quan la cua és
+# plena (o s'espera massa) es rebutja de seguida amb 503 + Retry-After.
+# Millor servir ràpid uns quants usuaris que servir-los tots lents.
+
+ADMISSION_IN_FLIGHT = Gauge("wrapped_admission_in_flight", "Tasks running per stage.", ["stage"])
+ADMISSION_QUEUE_DEPTH = Gauge("wrapped_admission_queue_depth", "Tasks waiting per stage.", ["stage"])
+ADMISSION_REJECTIONS = Counter(
+    "wrapped_admission_rejections_total", "Requests rejected by admission control.", ["stage", "reason"]
+)
+
+
+class Overloaded(Exception):
+    def __init__(self, stage: str, retry_after: int):
+        super().__init__(f"Stage '{stage}' overloaded")
+        self.stage = stage
+        self.retry_after = retry_after
+
+
+class AdmissionGate:
+    def __init__(self, stage: str, concurrency: int, max_queue: int,
+                 queue_timeout: float, retry_after: int):
+        self.stage = stage
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self._semaphore = None
+        self._executor = None
+        self._waiting = 0
+
+    def _reject(self, reason: str):
+        ADMISSION_REJECTIONS.inc(stage=self.stage, reason=reason)
+        raise Overloaded(self.stage, self.retry_after)
+
+    async def _acquire(self):
+        if self._semaphore is None:
+            # Es crea aquí per quedar lligat al bucle d'esdeveniments del worker
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix=f"gate-{self.stage}")
+
+        if self._semaphore.locked():
+            if self._waiting >= self.max_queue:
+                self._reject("queue_full")
+            self._waiting += 1
+            ADMISSION_QUEUE_DEPTH.set(self._waiting, stage=self.stage)
+            start = time.perf_counter()
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                self._reject("queue_timeout")
+            finally:
+                self._waiting -= 1
+                ADMISSION_QUEUE_DEPTH.set(self._waiting, stage=self.stage)
+                # L'espera a la cua també surt a la línia de temps de les peticions perfilades
+                profile = current_profile.get()
+                if profile is not None:
+                    profile.record_stage("admission_wait", {"gate": self.stage}, start, time.perf_counter() - start)
+        else:
+            await self._semaphore.acquire()
+
+        ADMISSION_IN_FLIGHT.inc(stage=self.stage)
+
+    def _release(self):
+        ADMISSION_IN_FLIGHT.dec(stage=self.stage)
+        self._semaphore.release()
+
+    async def run(self, fn, *args):
+        """Run a blocking function in this stage's threads once admitted."""
+        await self._acquire()
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        try:
+            future = self._executor.submit(context.run, profiled(fn), *args)
+        except BaseException:
+            self._release()
+            raise
+        # El permís s'allibera quan acaba el thread, no quan la petició es cancel·la:
+        # si el client se'n va, la feina continua i ha de seguir comptant al límit.
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self._release))
+        return await asyncio.wrap_future(future)
+
+
+FETCH_GATE = AdmissionGate(
+    "strava_fetch",
+    concurrency=config.ADMISSION_FETCH_CONCURRENCY,
+    max_queue=config.ADMISSION_FETCH_QUEUE,
+    queue_timeout=config.ADMISSION_QUEUE_TIMEOUT,
+    retry_after=config.ADMISSION_RETRY_AFTER,
+)
+RENDER_GATE = AdmissionGate(
+    "render",
+    concurrency=config.ADMISSION_RENDER_CONCURRENCY or os.cpu_count() or 1,
+    max_queue=config.ADMISSION_RENDER_QUEUE,
+    queue_timeout=config.ADMISSION_QUEUE_TIMEOUT,
+    retry_after=config.ADMISSION_RETRY_AFTER,
+)
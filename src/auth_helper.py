@@ -1,29 +1,30 @@
 from fastapi import Request, HTTPException
-import os
+from src.session_tokens import get_session
+from src.logger import get_logger
 
-# Necessitem importar SESSION_TOKENS de main.py
-# Per evitar import circular, ho fem d'una altra manera
+log = get_logger("auth")
 
-def get_current_athlete_id(request: Request) -> int:
+def get_current_athlete_id(request: Request, allow_query_token: bool = False) -> int:
     """
     Versió millorada: Accepta tant sessió (cookies) com token (header)
+    Amb allow_query_token també accepta ?token= (EventSource no pot enviar headers)
     """
     # Mètode 1: Token via header (per a Safari mòbil)
     token = request.headers.get("x-session-token")
+    if not token and allow_query_token:
+        token = request.query_params.get("token")
     if token:
-        # Import aquí per evitar circular dependencies
-        from src.main import SESSION_TOKENS
-        if token in SESSION_TOKENS:
-            athlete_data = SESSION_TOKENS[token]
-            print(f"🔑 [AUTH] Token vàlid, athlete_id: {athlete_data['athlete_id']}")
+        athlete_data = get_session(token)
+        if athlete_data:
+            log.debug("Token vàlid", extra={"athlete_id": athlete_data["athlete_id"]})
             return athlete_data["athlete_id"]
     
     # Mètode 2: Sessió tradicional (cookies)
     athlete_id = request.session.get("athlete_id")
     if athlete_id:
-        print(f"🍪 [AUTH] Sessió vàlida, athlete_id: {athlete_id}")
+        log.debug("Sessió vàlida", extra={"athlete_id": athlete_id})
         return athlete_id
     
     # Cap mètode vàlid
-    print(f"🚨 [AUTH] No autenticat. Token header: {bool(token)}, Session: {request.session.get('athlete_id')}")
+    log.info("No autenticat", extra={"has_token": bool(token), "has_session": bool(request.session.get("athlete_id"))})
     raise HTTPException(status_code=401, detail="Not authenticated")
\ No newline at end of file
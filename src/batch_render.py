@@ -0,0 +1,149 @@
+"""
+Pre-render per lots per a la campanya de final d'any.
+
+    STATE_BACKEND=redis python -m src.batch_render --ids athletes.txt
+
+Per a cada athlete_id (un per línia) calcula les estadístiques i escriu les
+targetes a STORAGE_ROOT/generated/<athlete_id>/wrapped. Les peticions a Strava
+es fan des del procés principal respectant el pressupost de rate limit, i el
+render (CPU) es reparteix en un pool de processos ("spawn": un fork després
+d'arrencar els threads de logging i de fetch podria heretar locks agafats).
+El manifest guarda la clau de les stats i plantilles amb què s'han fet les
+targetes, així no se serveixen si han canviat. Els atletes acabats
+s'afegeixen al fitxer de checkpoint, així es pot reprendre on s'ha quedat.
+Quan les targetes són recents, /wrapped/image les serveix directament.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from src import config
+from src.logger import get_logger
+from src.rate_budget import STRAVA_BUDGET
+from src.strava_client import get_wrapped_stats, get_empty_stats
+from src.token_manager import has_tokens
+
+log = get_logger("batch_render")
+
+
+def _render_athlete(athlete_id: int, stats: dict) -> int:
+    # S'executa en un procés del pool
+    from src.image_generator import generate_wrapped_images_to_disk
+    generate_wrapped_images_to_disk(stats, athlete_id, fmt="jpg")
+    return athlete_id
+
+
+def _fetch_stats(athlete_id: int):
+    if not has_tokens(athlete_id):
+        log.warning("Sense tokens, s'omet", extra={"athlete_id": athlete_id})
+        return athlete_id, None
+    stats = get_wrapped_stats(athlete_id)
+    # Sense activitats (o fetch fallit): no ho marquem com a fet, es reintentarà
+    if stats == get_empty_stats():
+        log.warning("Sense activitats, s'omet", extra={"athlete_id": athlete_id})
+        return athlete_id, None
+    return athlete_id, stats
+
+
+def read_athlete_ids(path: str):
+    with open(path) as f:
+        return [int(line.strip()) for line in f if line.strip() and not line.startswith("#")]
+
+
+def read_checkpoint(path: str) -> set:
+    if not os.path.exists(path):
+        return set()
+    with open(path) as f:
+        return {int(line) for line in f if line.strip()}
+
+
+def run_batch(athlete_ids, checkpoint_path: str, workers: int, fetch_concurrency: int):
+    done = read_checkpoint(checkpoint_path)
+    pending = [a for a in athlete_ids if a not in done]
+    total = len(pending)
+    log.info("Inici del lot", extra={"total": total, "already_done": len(done), "workers": workers})
+    if not pending:
+        return 0
+
+    # En mode batch sí que volem esperar que s'obri la finestra de 15 minuts
+    STRAVA_BUDGET.max_wait = 15 * 60
+
+    completed = failed = 0
+    start = time.time()
+    ids = iter(pending)
+    with open(checkpoint_path, "a") as checkpoint, \
+            ThreadPoolExecutor(max_workers=fetch_concurrency) as fetchers, \
+            ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as renderers:
+        fetching, rendering = set(), set()
+
+        def fill_fetchers():
+            while len(fetching) < fetch_concurrency:
+                # Si el pressupost diari s'ha esgotat, parem: el checkpoint permet reprendre demà
+                if STRAVA_BUDGET.seconds_until_available(1) > 15 * 60:
+                    return False
+                athlete_id = next(ids, None)
+                if athlete_id is None:
+                    return True
+                fetching.add(fetchers.submit(_fetch_stats, athlete_id))
+            return True
+
+        budget_ok = fill_fetchers()
+        while fetching or rendering:
+            finished, _ = wait(fetching | rendering, return_when=FIRST_COMPLETED)
+            for future in finished:
+                if future in fetching:
+                    fetching.discard(future)
+                    athlete_id, stats = future.result()
+                    if stats is None:
+                        failed += 1
+                    else:
+                        rendering.add(renderers.submit(_render_athlete, athlete_id, stats))
+                else:
+                    rendering.discard(future)
+                    try:
+                        athlete_id = future.result()
+                    except Exception:
+                        log.exception("Error renderitzant")
+                        failed += 1
+                        continue
+                    checkpoint.write(f"{athlete_id}\n")
+                    checkpoint.flush()
+                    completed += 1
+                    elapsed = time.time() - start
+                    rate = completed / elapsed if elapsed else 0.0
+                    eta = (total - completed - failed) / rate if rate else None
+                    log.info("Progrés", extra={
+                        "done": completed, "failed": failed, "total": total,
+                        "athletes_per_s": round(rate, 2), "eta_s": round(eta) if eta else None,
+                    })
+            if budget_ok:
+                budget_ok = fill_fetchers()
+
+    elapsed = time.time() - start
+    log.info("Lot acabat", extra={
+        "done": completed, "failed": failed, "remaining": total - completed - failed,
+        "elapsed_s": round(elapsed, 1), "athletes_per_s": round(completed / elapsed, 2) if elapsed else None,
+    })
+    return total - completed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ids", required=True, help="fitxer amb un athlete_id per línia")
+    parser.add_argument("--checkpoint", default="batch_render.checkpoint")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="processos de render")
+    parser.add_argument("--fetch-concurrency", type=int, default=4, help="peticions a Strava en paral·lel")
+    args = parser.parse_args(argv)
+
+    if config.STATE_BACKEND == "memory":
+        log.warning("STATE_BACKEND=memory: aquest procés no veurà els tokens dels usuaris; fes servir redis")
+
+    remaining = run_batch(read_athlete_ids(args.ids), args.checkpoint, args.workers, args.fetch_concurrency)
+    return 1 if remaining else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
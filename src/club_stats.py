@@ -0,0 +1,282 @@
+import secrets
+import time
+from typing import Optional
+
+from src.logger import get_logger
+from src.metrics import Histogram, CACHE_HITS, CACHE_MISSES
+from src.state_store import get_store
+
+# Wrapped de club a partir dels resums per atleta que deixa get_wrapped_stats
+# a l'store (summarize_activities): no es torna a demanar res a Strava. Tot el
+# que es combina és additiu, així que quan un membre s'actualitza només s'aplica
+# la diferència (nou - antic) a l'agregat de cada club seu. Només el màxim de
+# kudos pot obligar a recalcular-lo de zero, i això és una lectura en lot de
+# tots els resums (lineal amb el nombre de membres).
+# Tota escriptura de l'agregat (o del resum d'un membre) es fa amb el lock del
+# club; qui no l'aconsegueix l'invalida i marca el club com a brut perquè cap
+# agregat calculat en paral·lel amb dades velles es pugui desar.
+# Només hi poden entrar els membres del club a Strava (GET /athlete/clubs), i
+# el nom de l'activitat amb més kudos no es mostra si no és pública.
+
+log = get_logger("club_stats")
+
+SUMMARY_PREFIX = "wrapped_summary:"
+CLUB_PREFIX = "club:"
+ATHLETE_CLUBS_PREFIX = "athlete_clubs:"
+AGGREGATE_PREFIX = "club_aggregate:"
+LOCK_PREFIX = "club_lock:"
+DIRTY_PREFIX = "club_dirty:"
+STRAVA_CLUBS_PREFIX = "strava_clubs:"
+
+LOCK_TTL = 10
+LOCK_WAIT = 2
+STRAVA_CLUBS_TTL = 600  # la pertinença a Strava es torna a comprovar cada 10 minuts
+
+CLUB_SECONDS = Histogram(
+    "wrapped_club_aggregate_seconds", "Time to update or rebuild a club aggregate.", ["op"]
+)
+
+
+class NotClubMember(Exception):
+    pass
+
+
+class ClubBusy(Exception):
+    pass
+
+
+def _empty_aggregate() -> dict:
+    return {
+        "summary": {
+            "total_distance": 0, "total_time": 0, "total_elevation": 0, "total_watt_seconds": 0,
+            "total_kudos": 0, "total_photos": 0, "total_comments": 0, "total_athlets": 0,
+            "total_prs": 0, "total_activities": 0, "sports_counter": {}, "hour_counter": {},
+            "most_kudos_activity": {"name": None, "kudos": 0},
+        },
+        "most_kudos_athlete": None,
+        "members_with_stats": 0,
+        "updated_at": time.time(),
+    }
+
+
+def _shared_activity(best: dict) -> dict:
+    # La resta del club no ha de veure el nom d'una activitat privada (activity:read_all)
+    if best.get("private"):
+        return {**best, "name": None}
+    return dict(best)
+
+
+def _add_member(aggregate: dict, athlete_id: int, summary: dict, sign: int = 1):
+    from src.strava_client import merge_summaries, most_kudos_key
+
+    merge_summaries(aggregate["summary"], summary, sign)
+    aggregate["members_with_stats"] += sign
+    best = summary["most_kudos_activity"]
+    if sign > 0 and most_kudos_key(best) > most_kudos_key(aggregate["summary"]["most_kudos_activity"]):
+        aggregate["summary"]["most_kudos_activity"] = _shared_activity(best)
+        aggregate["most_kudos_athlete"] = athlete_id
+
+
+def _club_lock(club_id: str) -> Optional[str]:
+    """Lock curt a l'store (vàlid entre workers). None si no s'ha pogut obtenir."""
+    token = secrets.token_hex(8)
+    deadline = time.time() + LOCK_WAIT
+    while time.time() < deadline:
+        if get_store().set_if_absent(f"{LOCK_PREFIX}{club_id}", token, ttl=LOCK_TTL):
+            return token
+        time.sleep(0.01)
+    return None
+
+
+def _club_unlock(club_id: str, token: str):
+    store = get_store()
+    if store.get(f"{LOCK_PREFIX}{club_id}") == token:
+        store.delete(f"{LOCK_PREFIX}{club_id}")
+
+
+def _invalidate(club_id: str):
+    """Per a qui escriu sense el lock: esborra l'agregat i impedeix que se'n desi un de calculat abans."""
+    store = get_store()
+    store.set(f"{DIRTY_PREFIX}{club_id}", 1, ttl=2 * LOCK_TTL)
+    store.delete(f"{AGGREGATE_PREFIX}{club_id}")
+
+
+def _store_aggregate(club_id: str, aggregate: dict):
+    # Amb el lock agafat. Si mentrestant algú l'ha invalidat, l'agregat pot ser vell: fora
+    store = get_store()
+    store.set(f"{AGGREGATE_PREFIX}{club_id}", aggregate)
+    if store.get(f"{DIRTY_PREFIX}{club_id}") is not None:
+        store.delete(f"{AGGREGATE_PREFIX}{club_id}")
+
+
+def get_club(club_id: str) -> Optional[dict]:
+    return get_store().get(f"{CLUB_PREFIX}{club_id}")
+
+
+def clubs_for_athlete(athlete_id: int) -> list:
+    return get_store().get(f"{ATHLETE_CLUBS_PREFIX}{athlete_id}") or []
+
+
+def strava_clubs(athlete_id: int) -> dict:
+    """{club_id: nom} dels clubs de Strava de l'atleta, amb una cache curta a l'store."""
+    store = get_store()
+    key = f"{STRAVA_CLUBS_PREFIX}{athlete_id}"
+    clubs = store.get(key)
+    if clubs is None:
+        from src.strava_client import get_athlete_clubs
+        clubs = {str(club["id"]): club.get("name") for club in get_athlete_clubs(athlete_id)}
+        store.set(key, clubs, ttl=STRAVA_CLUBS_TTL)
+    return clubs
+
+
+def check_member(club_id: str, athlete_id: int) -> dict:
+    """El club, si l'atleta s'hi ha unit aquí i encara n'és membre a Strava."""
+    club = get_club(club_id)
+    if club is None or athlete_id not in club["members"] or club_id not in strava_clubs(athlete_id):
+        raise NotClubMember(club_id)
+    return club
+
+
+def join_club(club_id: str, athlete_id: int) -> dict:
+    """Afegeix l'atleta al club (el crea si no existeix) i hi suma el seu resum."""
+    membership = strava_clubs(athlete_id)
+    if club_id not in membership:
+        raise NotClubMember(club_id)
+
+    store = get_store()
+    token = _club_lock(club_id)
+    if token is None:
+        raise ClubBusy(club_id)
+    try:
+        club = get_club(club_id) or {"club_id": club_id, "name": membership[club_id] or club_id, "members": []}
+        if athlete_id in club["members"]:
+            return club
+        club["members"].append(athlete_id)
+        store.set(f"{CLUB_PREFIX}{club_id}", club)
+
+        clubs = clubs_for_athlete(athlete_id)
+        if club_id not in clubs:
+            store.set(f"{ATHLETE_CLUBS_PREFIX}{athlete_id}", clubs + [club_id])
+
+        summary = store.get(f"{SUMMARY_PREFIX}{athlete_id}")
+        aggregate = store.get(f"{AGGREGATE_PREFIX}{club_id}")
+        if aggregate is not None and summary is not None:
+            _add_member(aggregate, athlete_id, summary)
+            aggregate["updated_at"] = time.time()
+            _store_aggregate(club_id, aggregate)
+        return club
+    finally:
+        _club_unlock(club_id, token)
+
+
+def save_member_summary(athlete_id: int, summary: dict):
+    """
+    Desa el resum de l'atleta i aplica el canvi als agregats dels seus clubs.
+    Si no ha canviat respecte l'últim resum, no es toca res.
+    """
+    store = get_store()
+    key = f"{SUMMARY_PREFIX}{athlete_id}"
+    if store.get(key) == summary:
+        return
+
+    # El resum s'escriu amb els locks dels clubs agafats (en ordre, sense interbloquejos):
+    # una reconstrucció no el pot llegir entre l'escriptura i el delta i comptar-lo dos cops
+    clubs = sorted(clubs_for_athlete(athlete_id))
+    tokens = {club_id: _club_lock(club_id) for club_id in clubs}
+    try:
+        previous = store.get(key)
+        if previous == summary:
+            return
+        store.set(key, summary)
+        for club_id, token in tokens.items():
+            with CLUB_SECONDS.time(op="update"):
+                if token is None:
+                    log.warning("Lock de club ocupat, agregat invalidat", extra={"club_id": club_id})
+                    _invalidate(club_id)
+                else:
+                    _apply_member_change(club_id, athlete_id, previous, summary)
+        # S'ha unit a un club mentrestant: pot tenir el resum antic sumat
+        for club_id in set(clubs_for_athlete(athlete_id)) - set(clubs):
+            _invalidate(club_id)
+    finally:
+        for club_id, token in tokens.items():
+            if token:
+                _club_unlock(club_id, token)
+
+
+def _apply_member_change(club_id: str, athlete_id: int, previous: Optional[dict], summary: dict):
+    # Amb el lock del club agafat
+    store = get_store()
+    aggregate_key = f"{AGGREGATE_PREFIX}{club_id}"
+    aggregate = store.get(aggregate_key)
+    if aggregate is None:
+        return  # Encara no s'ha construït: es farà sencer quan es demani
+
+    if previous is not None:
+        _add_member(aggregate, athlete_id, previous, sign=-1)
+    _add_member(aggregate, athlete_id, summary)
+
+    if aggregate["most_kudos_athlete"] == athlete_id:
+        from src.strava_client import most_kudos_key
+        if most_kudos_key(summary["most_kudos_activity"]) < most_kudos_key(aggregate["summary"]["most_kudos_activity"]):
+            # El màxim era d'aquest atleta i ha baixat: un màxim no es pot restar
+            store.delete(aggregate_key)
+            return
+
+    aggregate["updated_at"] = time.time()
+    _store_aggregate(club_id, aggregate)
+
+
+def rebuild_aggregate(club_id: str) -> Optional[dict]:
+    """Agregat sencer: una sola lectura en lot de tots els resums dels membres."""
+    store = get_store()
+    token = _club_lock(club_id)
+    try:
+        club = get_club(club_id)
+        if club is None:
+            return None
+        with CLUB_SECONDS.time(op="rebuild"):
+            if token is not None:
+                store.delete(f"{DIRTY_PREFIX}{club_id}")
+            aggregate = _empty_aggregate()
+            members = club["members"]
+            summaries = store.get_many(f"{SUMMARY_PREFIX}{i}" for i in members)
+            for athlete_id, summary in zip(members, summaries):
+                if summary is not None:
+                    _add_member(aggregate, athlete_id, summary)
+            # Sense lock es respon igualment, però no es desa: la pròxima lectura el tornarà a fer
+            if token is not None:
+                _store_aggregate(club_id, aggregate)
+    finally:
+        if token is not None:
+            _club_unlock(club_id, token)
+    log.info("Agregat de club reconstruït", extra={"club_id": club_id, "members": len(members),
+                                                   "stored": token is not None})
+    return aggregate
+
+
+def get_club_aggregate(club_id: str) -> Optional[dict]:
+    aggregate = get_store().get(f"{AGGREGATE_PREFIX}{club_id}")
+    if aggregate is not None:
+        CACHE_HITS.inc(cache="club_aggregate")
+        return aggregate
+    CACHE_MISSES.inc(cache="club_aggregate")
+    return rebuild_aggregate(club_id)
+
+
+def get_club_wrapped_stats(club_id: str) -> Optional[dict]:
+    """Mateixes claus que get_wrapped_stats (serveixen les mateixes plantilles) + dades del club."""
+    from src.strava_client import format_wrapped_stats, get_empty_stats
+
+    club = get_club(club_id)
+    aggregate = get_club_aggregate(club_id)
+    if club is None or aggregate is None:
+        return None
+    if aggregate["summary"]["total_activities"] == 0:
+        stats = get_empty_stats()
+    else:
+        stats = format_wrapped_stats(aggregate["summary"])
+    stats["club_name"] = club["name"]
+    stats["club_members"] = len(club["members"])
+    stats["club_members_with_stats"] = aggregate["members_with_stats"]
+    return stats
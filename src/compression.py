@@ -0,0 +1,28 @@
+from starlette.middleware.gzip import GZipMiddleware
+
+# Compressió de respostes: brotli si hi ha brotli-asgi instal·lat (fa servir
+# gzip com a alternativa per als clients que no l'accepten), si no gzip.
+# Els streams SSE no es comprimeixen: el buffer del compressor retardaria els events.
+# Les stories (WebP/GIF/MP4) ja van comprimides.
+
+try:
+    from brotli_asgi import BrotliMiddleware
+except ImportError:  # Dependència opcional
+    BrotliMiddleware = None
+
+UNCOMPRESSED_PATHS = {"/wrapped/stream", "/wrapped/story"}
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = 1000):
+        self.app = app
+        if BrotliMiddleware is not None:
+            self.compressed_app = BrotliMiddleware(app, minimum_size=minimum_size)
+        else:
+            self.compressed_app = GZipMiddleware(app, minimum_size=minimum_size)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] not in UNCOMPRESSED_PATHS:
+            await self.compressed_app(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
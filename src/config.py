@@ -34,6 +34,99 @@ STRAVA_EXPIRES_AT = os.getenv("STRAVA_EXPIRES_AT")
 SECRET_KEY = os.getenv("SECRET_KEY")
 FRONTEND_URL = os.getenv("FRONTEND_URL")
 
+# URL base de Strava (configurable per apuntar a src/fake_strava.py en proves de càrrega)
+STRAVA_BASE_URL = os.getenv("STRAVA_BASE_URL", "https://www.strava.com").rstrip("/")
+STRAVA_API_URL = f"{STRAVA_BASE_URL}/api/v3"
+STRAVA_MAX_PAGES = int(os.getenv("STRAVA_MAX_PAGES", 10))
+# Límits inicials (15 min, diari); s'ajusten amb les capçaleres X-RateLimit de Strava
+STRAVA_RATE_LIMIT_15MIN = int(os.getenv("STRAVA_RATE_LIMIT_15MIN", 200))
+STRAVA_RATE_LIMIT_DAY = int(os.getenv("STRAVA_RATE_LIMIT_DAY", 2000))
+STRAVA_BUDGET_MAX_WAIT = float(os.getenv("STRAVA_BUDGET_MAX_WAIT", 0))
+
+# Cache de les activitats de l'últim any per athlete (segons)
+ACTIVITY_CACHE_TTL = int(os.getenv("ACTIVITY_CACHE_TTL", 15 * 60))
+
+# Compressió de respostes (bytes mínims per comprimir)
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", 1000))
+
+# Enriquiment amb el detall de les activitats (GET /activities/{id})
+# ENRICHED_CARDS: llista separada per comes de best_efforts, segment_prs, calories, devices, gear,
+# power_curve, hr_zones
+ENRICHED_CARDS = [c.strip() for c in os.getenv("ENRICHED_CARDS", "").split(",") if c.strip()]
+ENRICH_WORKERS = int(os.getenv("ENRICH_WORKERS", 8))
+
+# Targetes a partir dels streams (ENRICHED_CARDS amb power_curve, hr_zones)
+POWER_CURVE_DURATIONS = [int(d) for d in os.getenv("POWER_CURVE_DURATIONS", "5,60,300,1200,3600").split(",")]
+HR_MAX = int(os.getenv("HR_MAX", 190))
+# Límits de les zones Z1..Z5 com a fracció de HR_MAX
+HR_ZONE_PCTS = [float(p) for p in os.getenv("HR_ZONE_PCTS", "0.6,0.7,0.8,0.9").split(",")]
+
+# Control d'admissió: tasques en curs i cua d'espera per etapa (per worker)
+ADMISSION_FETCH_CONCURRENCY = int(os.getenv("ADMISSION_FETCH_CONCURRENCY", 8))
+ADMISSION_FETCH_QUEUE = int(os.getenv("ADMISSION_FETCH_QUEUE", 32))
+ADMISSION_RENDER_CONCURRENCY = int(os.getenv("ADMISSION_RENDER_CONCURRENCY", 0))  # 0 = nombre de CPUs
+ADMISSION_RENDER_QUEUE = int(os.getenv("ADMISSION_RENDER_QUEUE", 16))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", 10))
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", 5))
+
+# Importació de l'exportació de Strava (POST /import/strava_export)
+IMPORT_MAX_BYTES = int(os.getenv("IMPORT_MAX_BYTES", 1024 ** 3))  # mida màxima del .zip
+IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", 0))  # processos per als GPX, 0 = nombre de CPUs
+# L'export és una foto fixa: mentre dura, la finestra de l'últim any es torna a aplicar a cada
+# lectura (les activitats antigues en surten, les noves no hi entren). En caducar es torna a
+# l'API de Strava; sense API, l'usuari ha de tornar a pujar un export recent.
+IMPORT_CACHE_TTL = int(os.getenv("IMPORT_CACHE_TTL", 7 * 24 * 3600))  # segons
+
+# Story animada (GET /wrapped/story): tot amb ffmpeg si hi és; si no, WebP/GIF amb Pillow i sense MP4
+STORY_WIDTH = int(os.getenv("STORY_WIDTH", 540))  # px, l'alçada segueix la proporció de les targetes
+STORY_HOLD_MS = int(os.getenv("STORY_HOLD_MS", 2500))  # temps que es mostra cada targeta
+STORY_TRANSITION_MS = int(os.getenv("STORY_TRANSITION_MS", 400))
+STORY_TRANSITION_FRAMES = int(os.getenv("STORY_TRANSITION_FRAMES", 3))
+STORY_MP4_FPS = int(os.getenv("STORY_MP4_FPS", 24))
+STORY_ANIM_FPS = int(os.getenv("STORY_ANIM_FPS", 10))  # WebP/GIF amb ffmpeg: els fotogrames repetits hi ocupen poc
+FFMPEG_PATH = os.getenv("FFMPEG_PATH", "ffmpeg")
+STORY_ENCODE_TIMEOUT = int(os.getenv("STORY_ENCODE_TIMEOUT", 60))  # segons per fotograma i per tancar ffmpeg
+
+# Pre-render per lots (python -m src.batch_render)
+PRERENDER_MAX_AGE = int(os.getenv("PRERENDER_MAX_AGE", 24 * 3600))  # segons
+
+# Estat compartit: "memory" (un sol worker) o "redis" (multi-worker / multi-instància)
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory").lower()
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+STATE_NAMESPACE = os.getenv("STATE_NAMESPACE", "wrapped:")
+SESSION_TOKEN_TTL = int(os.getenv("SESSION_TOKEN_TTL", 24 * 3600))
+WORKER_PID_HEADER = os.getenv("WORKER_PID_HEADER", "0") == "1"  # X-Worker-PID a cada resposta (proves)
+
+# Jobs asíncrons de generació del Wrapped
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))
+JOB_MAX_PENDING = int(os.getenv("JOB_MAX_PENDING", 50))
+JOB_RESULT_TTL = int(os.getenv("JOB_RESULT_TTL", 600))  # segons que es guarda el resultat
+JOB_TIMEOUT = int(os.getenv("JOB_TIMEOUT", 300))
+
+# Logging: LOG_FORMAT=json|text, i mostreig de les línies DEBUG (0.0 - 1.0)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json" if is_production() else "text").lower()
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", 1.0))
+
+# Arrencada en fred: warmup en segon pla (plantilles, fonts, connexions HTTP)
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "1") == "1"
+TEMPLATE_CACHE = os.getenv("TEMPLATE_CACHE", "1") == "1"  # ~6 MB per plantilla descodificada
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", 10))
+
+# Profiling de peticions (desactivat si no hi ha secret ni mostreig)
+# Amb PROFILE_SECRET: capçalera "X-Profile: <secret>" (perfila la petició i dona accés a /debug/profiles)
+PROFILE_SECRET = os.getenv("PROFILE_SECRET", "")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0.0))  # 0.0 - 1.0
+PROFILE_MODE = os.getenv("PROFILE_MODE", "both").lower()  # cprofile | sampling | both
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", 5))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join("storage", "profiles"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", 50))  # perfils que es conserven a disc
+
 # Verificació
 if not SECRET_KEY or SECRET_KEY == "super-secret-production-key":
-    raise ValueError("Cal configurar una SECRET_KEY vàlida a producció!")
\ No newline at end of file
+    raise ValueError("Cal configurar una SECRET_KEY vàlida a producció!")
+
+if STATE_BACKEND not in ("memory", "redis"):
+    raise ValueError(f"STATE_BACKEND desconegut: {STATE_BACKEND}")
+if PROFILE_MODE not in ("cprofile", "sampling", "both"):
+    raise ValueError(f"PROFILE_MODE desconegut: {PROFILE_MODE}")
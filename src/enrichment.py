@@ -0,0 +1,162 @@
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from src import config
+from src.http_client import get_http_session
+from src.logger import get_logger
+from src.metrics import Histogram, CACHE_HITS, CACHE_MISSES, ERRORS, RATE_LIMIT_DEFERRALS
+from src.rate_budget import STRAVA_BUDGET
+from src.state_store import get_store
+
+# Enriquiment amb el detall de cada activitat (GET /activities/{id}): best
+# efforts, PRs de segments, calories, dispositiu i material. Només es demanen
+# les activitats que necessiten les targetes activades (ENRICHED_CARDS), en
+# paral·lel amb un pool acotat i dins del pressupost de Strava. El detall
+# gairebé mai canvia, així que es guarda per sempre per activity id.
+
+log = get_logger("enrichment")
+
+DETAIL_PREFIX = "activity_detail:"
+RUN_SPORTS = {"Run", "TrailRun", "VirtualRun"}
+BEST_EFFORT_NAMES = ["1k", "5k", "10k", "Half-Marathon", "Marathon"]
+
+# Targeta -> quines activitats necessita en detall
+CARD_REQUIREMENTS = {
+    "best_efforts": lambda a: a.get("sport_type") in RUN_SPORTS,
+    "segment_prs": lambda a: a.get("pr_count", 0) > 0,
+    "calories": lambda a: True,
+    "devices": lambda a: True,
+    "gear": lambda a: bool(a.get("gear_id")),
+}
+
+ENRICHMENT_SECONDS = Histogram(
+    "wrapped_enrichment_seconds", "Time to fetch/load detailed activities for enabled cards."
+)
+
+_executor = ThreadPoolExecutor(max_workers=config.ENRICH_WORKERS, thread_name_prefix="enrich")
+
+
+def enabled_cards() -> list:
+    return [card for card in config.ENRICHED_CARDS if card in CARD_REQUIREMENTS]
+
+
+def activities_needing_details(activities: list, cards: list) -> list:
+    checks = [CARD_REQUIREMENTS[card] for card in cards]
+    return [a for a in activities if any(check(a) for check in checks)]
+
+
+def _trim_detail(detail: dict) -> dict:
+    """Només els camps que fan servir les targetes: el detall complet és molt gran."""
+    return {
+        "id": detail.get("id"),
+        "name": detail.get("name"),
+        "calories": detail.get("calories"),
+        "device_name": detail.get("device_name"),
+        "gear": {"id": detail["gear"].get("id"), "name": detail["gear"].get("name")} if detail.get("gear") else None,
+        "distance": detail.get("distance", 0),
+        "best_efforts": [
+            {"name": e.get("name"), "elapsed_time": e.get("elapsed_time")}
+            for e in detail.get("best_efforts") or []
+        ],
+        "segment_prs": sum(1 for e in detail.get("segment_efforts") or [] if e.get("pr_rank") == 1),
+    }
+
+
+def _fetch_detail(activity_id: int, access_token: str):
+    if not STRAVA_BUDGET.acquire():
+        return None
+    try:
+        response = get_http_session().get(
+            f"{config.STRAVA_API_URL}/activities/{activity_id}",
+            headers={"Authorization": f"Bearer {access_token}"},
+            timeout=15,
+        )
+    except requests.RequestException as e:
+        log.warning("Error obtenint detall: %s", e, extra={"activity_id": activity_id})
+        ERRORS.inc(stage="enrichment")
+        return None
+    STRAVA_BUDGET.update_from_headers(response.headers)
+    if response.status_code == 429:
+        RATE_LIMIT_DEFERRALS.inc(source="strava")
+    if response.status_code != 200:
+        ERRORS.inc(stage="enrichment")
+        return None
+    detail = _trim_detail(response.json())
+    get_store().set(f"{DETAIL_PREFIX}{activity_id}", detail)
+    return detail
+
+
+def load_details(activities: list, access_token: str) -> dict:
+    """
+    Return {activity_id: trimmed detail}. Cached details come from the store in a
+    single batch read; the rest are fetched concurrently.
+    """
+    ids = [a["id"] for a in activities if "id" in a]
+    cached = get_store().get_many(f"{DETAIL_PREFIX}{i}" for i in ids)
+    details = {i: d for i, d in zip(ids, cached) if d is not None}
+    missing = [i for i in ids if i not in details]
+    CACHE_HITS.inc(len(details), cache="activity_detail")
+    CACHE_MISSES.inc(len(missing), cache="activity_detail")
+
+    for activity_id, detail in zip(missing, _executor.map(lambda i: _fetch_detail(i, access_token), missing)):
+        if detail is not None:
+            details[activity_id] = detail
+    if len(details) < len(ids):
+        log.info("Enriquiment parcial", extra={"wanted": len(ids), "got": len(details)})
+    return details
+
+
+def _format_duration(seconds: int) -> str:
+    hours, rest = divmod(int(seconds), 3600)
+    minutes, secs = divmod(rest, 60)
+    return f"{hours}:{minutes:02d}:{secs:02d}" if hours else f"{minutes}:{secs:02d}"
+
+
+def enriched_stats(details: dict, cards: list) -> dict:
+    stats = {}
+    values = list(details.values())
+
+    if "best_efforts" in cards:
+        best = {}
+        for d in values:
+            for effort in d["best_efforts"]:
+                name, elapsed = effort["name"], effort["elapsed_time"]
+                if name in BEST_EFFORT_NAMES and elapsed and (name not in best or elapsed < best[name]["seconds"]):
+                    best[name] = {"seconds": elapsed, "time": _format_duration(elapsed), "activity": d["name"]}
+        stats["best_efforts"] = {name: best[name] for name in BEST_EFFORT_NAMES if name in best}
+
+    if "segment_prs" in cards:
+        stats["segment_prs"] = sum(d["segment_prs"] for d in values)
+
+    if "calories" in cards:
+        stats["total_calories"] = str(int(sum(d["calories"] or 0 for d in values))) + " kcal"
+
+    if "devices" in cards:
+        devices = Counter(d["device_name"] for d in values if d["device_name"])
+        stats["main_device"] = devices.most_common(1)[0][0] if devices else None
+
+    if "gear" in cards:
+        gear_km = Counter()
+        for d in values:
+            if d["gear"] and d["gear"]["name"]:
+                gear_km[d["gear"]["name"]] += (d["distance"] or 0) / 1000
+        if gear_km:
+            name, km = gear_km.most_common(1)[0]
+            stats["main_gear"] = {"name": name, "km": str(round(km, 1)) + " Km"}
+        else:
+            stats["main_gear"] = {"name": None, "km": "0.0 Km"}
+
+    return stats
+
+
+def enrich_wrapped_stats(activities: list, access_token: str) -> dict:
+    """Extra stats for the enabled cards ({} when none are enabled)."""
+    cards = enabled_cards()
+    if not cards:
+        return {}
+    with ENRICHMENT_SECONDS.time():
+        needed = activities_needing_details(activities, cards)
+        details = load_details(needed, access_token)
+        return enriched_stats(details, cards)
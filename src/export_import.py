@@ -0,0 +1,311 @@
+import csv
+import gzip
+import io
+import math
+import multiprocessing
+import os
+import threading
+import zipfile
+import xml.etree.ElementTree as ET
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from src import activity_cache, config
+from src.logger import get_logger
+from src.metrics import Histogram
+
+# Importació de l'exportació del compte de Strava (export_XXXX.zip): el
+# activities.csv es llegeix en streaming des del zip, sense extreure res a
+# disc, i cada fila es converteix als mateixos camps que retorna
+# /athlete/activities. Les files sense distància/temps/desnivell (exports
+# antics) es completen amb el seu GPX. El parseig és un bucle Python (expat no
+# allibera el GIL), així que es reparteix en un pool de processos "spawn" (un
+# fork del worker d'uvicorn, que té threads, no és segur): el pare llegeix els
+# bytes de cada GPX del zip i els fills els descomprimeixen i parsegen, amb un
+# nombre limitat d'encàrrecs en vol perquè la memòria no creixi amb l'export.
+# El zip es llegeix directament del fitxer temporal de la pujada, sense
+# copiar-lo (no té path que els fills puguin obrir). El resultat va
+# a la cache d'activitats durant IMPORT_CACHE_TTL, així /wrapped i
+# /wrapped/image funcionen igual però sense cap crida a l'API.
+
+log = get_logger("export_import")
+
+CSV_NAME = "activities.csv"
+MIN_PARALLEL_GPX = 16  # per sota d'això no val la pena repartir-los
+# Entre dos punts GPX: més separats es considera pausa, més lent es considera aturat
+GPX_MAX_GAP_S = 30
+GPX_MIN_SPEED = 0.5  # m/s
+
+IMPORT_SECONDS = Histogram(
+    "wrapped_export_import_seconds", "Time to import a Strava account export.", ["phase"]
+)
+
+
+class ExportImportError(ValueError):
+    pass
+
+
+GPX_WORKERS = config.IMPORT_WORKERS or os.cpu_count() or 1
+GPX_IN_FLIGHT = 2 * GPX_WORKERS  # GPX llegits i pendents de parsejar com a màxim
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _gpx_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=GPX_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        _pool = None
+
+
+def _float(value: str) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return float(value.replace(",", ""))
+    except ValueError:
+        return None
+
+
+def _parse_date(value: str) -> Optional[datetime]:
+    # Format de l'export: "Jan 5, 2024, 7:31:02 AM", en UTC
+    for fmt in ("%b %d, %Y, %I:%M:%S %p", "%Y-%m-%d %H:%M:%S"):
+        try:
+            return datetime.strptime(value.strip(), fmt).replace(tzinfo=timezone.utc)
+        except ValueError:
+            continue
+    return None
+
+
+def _iso(dt: datetime) -> str:
+    return dt.isoformat().replace("+00:00", "Z")
+
+
+def _row_to_activity(row: list, columns: dict, repeated: set) -> dict:
+    def col(name):
+        index = columns.get(name)
+        return row[index].strip() if index is not None and index < len(row) else ""
+
+    # Hi ha columnes repetides (Distance, Elapsed Time): la segona és la detallada, en
+    # metres i segons. Si només n'hi ha una, Distance és en km.
+    distance = _float(col("Distance"))
+    if distance is not None and "Distance" not in repeated:
+        distance *= 1000
+    start = _parse_date(col("Activity Date"))
+    sport = col("Activity Type").replace(" ", "").replace("-", "") or "Unknown"
+    media = [m for m in col("Media").split("|") if m]
+    watts = _float(col("Weighted Average Power")) or _float(col("Average Watts"))
+
+    activity = {
+        "id": int(col("Activity ID")),
+        "name": col("Activity Name"),
+        "sport_type": sport,
+        "type": sport,
+        "distance": distance,
+        "moving_time": _float(col("Moving Time")),
+        "elapsed_time": _float(col("Elapsed Time")),
+        "total_elevation_gain": _float(col("Elevation Gain")),
+        "start_date": _iso(start) if start else None,
+        # L'export no porta la part social
+        "kudos_count": 0,
+        "comment_count": 0,
+        "athlete_count": 1,
+        "total_photo_count": len(media),
+        "pr_count": 0,
+        "has_heartrate": _float(col("Max Heart Rate")) is not None,
+        "_file": col("Filename"),
+    }
+    if watts:
+        activity["weighted_average_watts"] = watts
+        activity["device_watts"] = True
+    return activity
+
+
+def _needs_gpx(activity: dict) -> bool:
+    missing = any(activity[k] is None for k in ("distance", "moving_time", "total_elevation_gain", "start_date"))
+    return missing and activity["_file"].endswith((".gpx", ".gpx.gz"))
+
+
+def _open_member(zf: zipfile.ZipFile, name: str):
+    raw = zf.open(name)
+    return gzip.GzipFile(fileobj=raw) if name.endswith(".gz") else raw
+
+
+def _haversine(lat1, lon1, lat2, lon2) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * 6_371_000 * math.asin(math.sqrt(a))
+
+
+def parse_gpx(stream) -> Optional[dict]:
+    """Distància, temps en moviment i desnivell positiu d'un GPX, en streaming."""
+    distance = elevation_gain = moving_time = 0.0
+    prev = start = end = None
+    for _, elem in ET.iterparse(stream, events=("end",)):
+        if not elem.tag.endswith("trkpt"):
+            continue
+        point = {"lat": float(elem.get("lat")), "lon": float(elem.get("lon")), "ele": None, "time": None}
+        for child in elem:
+            if child.tag.endswith("ele") and child.text:
+                point["ele"] = float(child.text)
+            elif child.tag.endswith("time") and child.text:
+                point["time"] = datetime.fromisoformat(child.text.strip().replace("Z", "+00:00"))
+        elem.clear()
+
+        if point["time"] is not None:
+            start = start or point["time"]
+            end = point["time"]
+        if prev is not None:
+            step = _haversine(prev["lat"], prev["lon"], point["lat"], point["lon"])
+            distance += step
+            if prev["ele"] is not None and point["ele"] is not None and point["ele"] > prev["ele"]:
+                elevation_gain += point["ele"] - prev["ele"]
+            if prev["time"] is not None and point["time"] is not None:
+                dt = (point["time"] - prev["time"]).total_seconds()
+                if 0 < dt <= GPX_MAX_GAP_S and step / dt >= GPX_MIN_SPEED:
+                    moving_time += dt
+        prev = point
+
+    if prev is None:
+        return None
+    return {
+        "distance": round(distance, 1),
+        "moving_time": int(moving_time),
+        "elapsed_time": int((end - start).total_seconds()) if start and end else None,
+        "total_elevation_gain": round(elevation_gain, 1),
+        "start_date": _iso(start.astimezone(timezone.utc)) if start else None,
+    }
+
+
+def _parse_gpx_member(zf: zipfile.ZipFile, name: str) -> Optional[dict]:
+    try:
+        with _open_member(zf, name) as stream:
+            return parse_gpx(stream)
+    except (KeyError, OSError, ET.ParseError, ValueError, zipfile.BadZipFile):
+        return None
+
+
+def _parse_gpx_bytes(name: str, data: bytes) -> Optional[dict]:
+    # S'executa en un procés del pool
+    try:
+        stream = io.BytesIO(data)
+        if name.endswith(".gz"):
+            stream = gzip.GzipFile(fileobj=stream)
+        return parse_gpx(stream)
+    except (OSError, EOFError, ET.ParseError, ValueError):
+        return None
+
+
+def _parse_gpx_files(zf: zipfile.ZipFile, names: list) -> dict:
+    if len(names) < MIN_PARALLEL_GPX:
+        return {name: _parse_gpx_member(zf, name) for name in names}
+
+    pool = _gpx_pool()
+    parsed, pending = {}, {}
+
+    def collect(futures):
+        for future in futures:
+            parsed[pending.pop(future)] = future.result()
+
+    try:
+        for name in names:
+            try:
+                data = zf.read(name)
+            except (KeyError, OSError, zipfile.BadZipFile):
+                parsed[name] = None
+                continue
+            pending[pool.submit(_parse_gpx_bytes, name, data)] = name
+            if len(pending) >= GPX_IN_FLIGHT:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+        collect(list(pending))
+    except BrokenProcessPool:
+        # Un fill ha mort (p. ex. l'OOM killer): el pool no es pot reutilitzar
+        _reset_pool()
+        raise
+    return parsed
+
+
+def _find_csv(zf: zipfile.ZipFile) -> str:
+    candidates = [n for n in zf.namelist() if n == CSV_NAME or n.endswith("/" + CSV_NAME)]
+    if not candidates:
+        raise ExportImportError("activities.csv not found in the export")
+    return min(candidates, key=lambda n: n.count("/"))
+
+
+def read_activities(archive) -> tuple:
+    """Return (activities, stats) for the last year from a Strava export .zip (path or file object)."""
+    one_year_ago = datetime.now(timezone.utc) - timedelta(days=365)
+    try:
+        zf = zipfile.ZipFile(archive)
+    except zipfile.BadZipFile:
+        raise ExportImportError("Not a zip file")
+
+    activities, rows, invalid = [], 0, 0
+    with zf:
+        with IMPORT_SECONDS.time(phase="csv"):
+            csv_name = _find_csv(zf)
+            base_dir = csv_name[:-len(CSV_NAME)]
+            with io.TextIOWrapper(zf.open(csv_name), encoding="utf-8-sig", newline="") as text:
+                reader = csv.reader(text)
+                header = next(reader, [])
+                columns = {name: i for i, name in enumerate(header)}  # la darrera aparició guanya
+                repeated = {name for name in columns if header.count(name) > 1}
+                for row in reader:
+                    rows += 1
+                    try:
+                        activity = _row_to_activity(row, columns, repeated)
+                    except (ValueError, IndexError):
+                        invalid += 1
+                        continue
+                    if activity["_file"]:
+                        activity["_file"] = base_dir + activity["_file"]
+                    activities.append(activity)
+
+        gpx_names = [a["_file"] for a in activities if _needs_gpx(a)]
+        if gpx_names:
+            with IMPORT_SECONDS.time(phase="gpx"):
+                parsed = _parse_gpx_files(zf, gpx_names)
+            for activity in activities:
+                fields = parsed.get(activity["_file"])
+                if fields:
+                    for key, value in fields.items():
+                        if activity[key] is None:
+                            activity[key] = value
+
+    cutoff = _iso(one_year_ago)
+    last_year = []
+    for activity in activities:
+        del activity["_file"]
+        if activity["start_date"] is None or activity["start_date"] <= cutoff:
+            continue
+        for key in ("distance", "moving_time", "elapsed_time", "total_elevation_gain"):
+            activity[key] = activity[key] or 0
+        activity["moving_time"] = int(activity["moving_time"] or activity["elapsed_time"])
+        activity["elapsed_time"] = int(activity["elapsed_time"])
+        last_year.append(activity)
+    last_year.sort(key=lambda a: a["start_date"])
+
+    stats = {"rows": rows, "invalid_rows": invalid, "gpx_parsed": len(gpx_names), "imported": len(last_year)}
+    return last_year, stats
+
+
+def import_strava_export(athlete_id: int, archive) -> dict:
+    """Importa l'export (path o fitxer) a la cache d'activitats de l'atleta. Retorna el recompte."""
+    activities, stats = read_activities(archive)
+    one_year_ago = int((datetime.now(timezone.utc) - timedelta(days=365)).timestamp())
+    activity_cache.save_activities(athlete_id, activities, one_year_ago,
+                                   ttl=config.IMPORT_CACHE_TTL, source="export")
+    log.info("Export importat", extra={"athlete_id": athlete_id, **stats})
+    return stats
@@ -0,0 +1,256 @@
+"""
+Servidor Strava fals per a proves de càrrega locals (no fa cap crida a Strava).
+
+    uvicorn src.fake_strava:app --port 9000
+    STRAVA_BASE_URL=http://localhost:9000 uvicorn src.main:app
+
+Serveix l'OAuth (authorize, intercanvi de codi i refresh), /athlete/activities
+paginat, /athlete/clubs, /activities/{id} i /activities/{id}/streams amb atletes sintètics deterministes. Variables d'entorn:
+
+    FAKE_STRAVA_ACTIVITIES   activitats per atleta (per defecte 150)
+    FAKE_STRAVA_LATENCY_MS   latència afegida a cada resposta (per defecte 50)
+    FAKE_STRAVA_JITTER_MS    variació aleatòria de la latència (per defecte 20)
+    FAKE_STRAVA_RATE_LIMIT   límits "15min,diari" com Strava (per defecte "600,30000")
+"""
+import asyncio
+import os
+import random
+import secrets
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from urllib.parse import parse_qs, urlencode
+
+from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import JSONResponse, RedirectResponse
+
+ACTIVITIES_PER_ATHLETE = int(os.getenv("FAKE_STRAVA_ACTIVITIES", 150))
+LATENCY_MS = float(os.getenv("FAKE_STRAVA_LATENCY_MS", 50))
+JITTER_MS = float(os.getenv("FAKE_STRAVA_JITTER_MS", 20))
+RATE_LIMITS = [int(x) for x in os.getenv("FAKE_STRAVA_RATE_LIMIT", "600,30000").split(",")]
+
+SPORTS = ["Run", "Ride", "TrailRun", "Walk", "Hike", "Swim", "GravelRide", "WeightTraining", "Yoga"]
+
+app = FastAPI()
+
+_tokens = {}  # access/refresh token -> athlete_id
+_tokens_lock = threading.Lock()
+_usage = {"window_15": 0, "day": 0, "window_started": time.time(), "day_started": time.time()}
+_usage_lock = threading.Lock()
+
+
+def _rate_limit_headers():
+    """Compta la petició i retorna (headers, excedit) amb el format de Strava."""
+    now = time.time()
+    with _usage_lock:
+        if now - _usage["window_started"] >= 900:
+            _usage["window_15"], _usage["window_started"] = 0, now
+        if now - _usage["day_started"] >= 86400:
+            _usage["day"], _usage["day_started"] = 0, now
+        _usage["window_15"] += 1
+        _usage["day"] += 1
+        usage = (_usage["window_15"], _usage["day"])
+    headers = {
+        "X-RateLimit-Limit": f"{RATE_LIMITS[0]},{RATE_LIMITS[1]}",
+        "X-RateLimit-Usage": f"{usage[0]},{usage[1]}",
+    }
+    return headers, usage[0] > RATE_LIMITS[0] or usage[1] > RATE_LIMITS[1]
+
+
+async def _latency():
+    delay = LATENCY_MS + random.uniform(-JITTER_MS, JITTER_MS)
+    if delay > 0:
+        await asyncio.sleep(delay / 1000)
+
+
+def _issue_tokens(athlete_id: int) -> dict:
+    access_token = f"fake-at-{secrets.token_hex(12)}"
+    refresh_token = f"fake-rt-{secrets.token_hex(12)}"
+    with _tokens_lock:
+        _tokens[access_token] = athlete_id
+        _tokens[refresh_token] = athlete_id
+    return {
+        "token_type": "Bearer",
+        "access_token": access_token,
+        "refresh_token": refresh_token,
+        "expires_at": int(time.time()) + 6 * 3600,
+        "expires_in": 6 * 3600,
+    }
+
+
+def _athlete_from_auth(request: Request) -> int:
+    auth = request.headers.get("authorization", "")
+    token = auth[len("Bearer "):] if auth.startswith("Bearer ") else ""
+    athlete_id = _tokens.get(token)
+    if athlete_id is None:
+        raise HTTPException(status_code=401, detail="Authorization Error")
+    return athlete_id
+
+
+@lru_cache(maxsize=1024)
+def synthetic_activities(athlete_id: int, count: int = ACTIVITIES_PER_ATHLETE):
+    """Activitats deterministes per atleta, ordenades per data ascendent (com amb ?after=)."""
+    rng = random.Random(athlete_id)
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    activities = []
+    for i in range(count):
+        sport = rng.choice(SPORTS)
+        moving_time = rng.randint(900, 4 * 3600)
+        distance = 0.0 if sport in ("WeightTraining", "Yoga") else moving_time * rng.uniform(1.0, 8.0)
+        start = now - timedelta(seconds=rng.randint(0, 364 * 86400))
+        activity = {
+            "id": athlete_id * 100_000 + i,
+            "athlete": {"id": athlete_id},
+            "name": f"{sport} #{i}",
+            "sport_type": sport,
+            "type": sport,
+            "distance": round(distance, 1),
+            "moving_time": moving_time,
+            "elapsed_time": moving_time + rng.randint(0, 900),
+            "total_elevation_gain": round(rng.uniform(0, 1500), 1),
+            "start_date": start.isoformat().replace("+00:00", "Z"),
+            "kudos_count": rng.randint(0, 60),
+            "comment_count": rng.randint(0, 8),
+            "athlete_count": rng.randint(1, 6),
+            "total_photo_count": rng.randint(0, 4),
+            "pr_count": rng.randint(0, 5),
+            "visibility": "only_me" if i % 10 == 0 else "everyone",
+            "private": i % 10 == 0,
+            # Polilínia sintètica: el pes real d'aquest camp és el que volem reproduir
+            "map": {"id": f"a{athlete_id}{i}", "summary_polyline": secrets.token_urlsafe(rng.randint(300, 900))},
+        }
+        if sport in ("Ride", "GravelRide"):
+            activity["weighted_average_watts"] = rng.randint(120, 300)
+            activity["device_watts"] = True
+        if sport in ("Run", "TrailRun", "Ride", "GravelRide"):
+            activity["has_heartrate"] = True
+        activities.append(activity)
+    activities.sort(key=lambda a: a["start_date"])
+    return activities
+
+
+@app.get("/oauth/authorize")
+def authorize(redirect_uri: str, state: str = None, athlete_id: int = None):
+    athlete_id = athlete_id or random.randint(1, 10_000_000)
+    params = {"code": f"fake-{athlete_id}", "scope": "read,activity:read_all"}
+    if state:
+        params["state"] = state
+    return RedirectResponse(f"{redirect_uri}?{urlencode(params)}")
+
+
+@app.post("/oauth/token")
+async def token(request: Request):
+    await _latency()
+    # Parseig manual del formulari: no cal python-multipart
+    form = {k: v[0] for k, v in parse_qs((await request.body()).decode()).items()}
+    grant_type = form.get("grant_type")
+
+    if grant_type == "authorization_code":
+        code = form.get("code", "")
+        if not code.startswith("fake-"):
+            raise HTTPException(status_code=400, detail="Bad Request: invalid code")
+        athlete_id = int(code[len("fake-"):])
+        data = _issue_tokens(athlete_id)
+        data["athlete"] = {"id": athlete_id, "firstname": "Fake", "lastname": str(athlete_id)}
+        return data
+
+    if grant_type == "refresh_token":
+        athlete_id = _tokens.get(form.get("refresh_token"))
+        if athlete_id is None:
+            raise HTTPException(status_code=400, detail="Bad Request: invalid refresh_token")
+        return _issue_tokens(athlete_id)
+
+    raise HTTPException(status_code=400, detail="Bad Request: grant_type")
+
+
+@app.get("/api/v3/athlete/activities")
+async def athlete_activities(request: Request, page: int = 1, per_page: int = 30,
+                             after: int = None, before: int = None):
+    headers, exceeded = _rate_limit_headers()
+    await _latency()
+    if exceeded:
+        return JSONResponse({"message": "Rate Limit Exceeded"}, status_code=429, headers=headers)
+
+    athlete_id = _athlete_from_auth(request)
+    activities = synthetic_activities(athlete_id)
+    if after is not None or before is not None:
+        after_iso = datetime.fromtimestamp(after or 0, timezone.utc).isoformat().replace("+00:00", "Z")
+        before_iso = datetime.fromtimestamp(before, timezone.utc).isoformat().replace("+00:00", "Z") if before else None
+        activities = [a for a in activities
+                      if a["start_date"] > after_iso and (before_iso is None or a["start_date"] < before_iso)]
+
+    per_page = max(1, min(per_page, 200))
+    offset = (max(page, 1) - 1) * per_page
+    return JSONResponse(activities[offset:offset + per_page], headers=headers)
+
+
+@app.get("/api/v3/athlete/clubs")
+async def athlete_clubs(request: Request):
+    headers, exceeded = _rate_limit_headers()
+    await _latency()
+    if exceeded:
+        return JSONResponse({"message": "Rate Limit Exceeded"}, status_code=429, headers=headers)
+
+    # Un club comú a tothom i un de cada tres (per provar els Wrapped de club)
+    athlete_id = _athlete_from_auth(request)
+    clubs = [{"id": 1, "name": "Club Fals"}, {"id": 100 + athlete_id % 3, "name": f"Club Fals {athlete_id % 3}"}]
+    return JSONResponse(clubs, headers=headers)
+
+
+@app.get("/api/v3/activities/{activity_id}")
+async def activity_detail(request: Request, activity_id: int):
+    headers, exceeded = _rate_limit_headers()
+    await _latency()
+    if exceeded:
+        return JSONResponse({"message": "Rate Limit Exceeded"}, status_code=429, headers=headers)
+
+    athlete_id = _athlete_from_auth(request)
+    index = activity_id - athlete_id * 100_000
+    activities = synthetic_activities(athlete_id)
+    summary = next((a for a in activities if a["id"] == activity_id), None) if 0 <= index < len(activities) else None
+    if summary is None:
+        raise HTTPException(status_code=404, detail="Record Not Found")
+
+    rng = random.Random(activity_id)
+    detail = dict(summary)
+    detail["calories"] = round(summary["moving_time"] / 60 * rng.uniform(6, 14), 1)
+    detail["device_name"] = rng.choice(["Garmin Forerunner 255", "Wahoo ELEMNT BOLT", "Strava iPhone App"])
+    detail["gear"] = {"id": f"g{athlete_id % 3}", "name": f"Material {athlete_id % 3}"}
+    if summary["sport_type"] in ("Run", "TrailRun"):
+        pace = rng.uniform(240, 420)  # s/km
+        detail["best_efforts"] = [
+            {"name": name, "distance": meters, "elapsed_time": int(meters / 1000 * pace)}
+            for name, meters in (("1k", 1000), ("5k", 5000), ("10k", 10000))
+            if meters <= summary["distance"]
+        ]
+    detail["segment_efforts"] = [{"pr_rank": 1 if i < summary["pr_count"] else None} for i in range(rng.randint(0, 10))]
+    return JSONResponse(detail, headers=headers)
+
+
+@app.get("/api/v3/activities/{activity_id}/streams")
+async def activity_streams(request: Request, activity_id: int, keys: str = "time"):
+    headers, exceeded = _rate_limit_headers()
+    await _latency()
+    if exceeded:
+        return JSONResponse({"message": "Rate Limit Exceeded"}, status_code=429, headers=headers)
+
+    athlete_id = _athlete_from_auth(request)
+    index = activity_id - athlete_id * 100_000
+    activities = synthetic_activities(athlete_id)
+    summary = next((a for a in activities if a["id"] == activity_id), None) if 0 <= index < len(activities) else None
+    if summary is None:
+        raise HTTPException(status_code=404, detail="Record Not Found")
+
+    # Una mostra per segon amb algun forat, com un dispositiu real
+    rng = random.Random(activity_id)
+    seconds = summary["moving_time"]
+    time_s = [t for t in range(seconds) if rng.random() > 0.02]
+    wanted = set(keys.split(","))
+    streams = {"time": {"data": time_s, "series_type": "time", "original_size": len(time_s)}}
+    if "watts" in wanted and summary.get("device_watts"):
+        base = summary["weighted_average_watts"]
+        streams["watts"] = {"data": [max(0, int(rng.gauss(base, base * 0.3))) for _ in time_s]}
+    if "heartrate" in wanted and summary.get("has_heartrate"):
+        streams["heartrate"] = {"data": [int(rng.uniform(110, 185)) for _ in time_s]}
+    return JSONResponse(streams, headers=headers)
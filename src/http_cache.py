@@ -0,0 +1,91 @@
+import hashlib
+import json
+
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+
+# Cache HTTP: ETags dèbils calculats del contingut (identifiquen les dades,
+# no els bytes: la mateixa resposta pot sortir en identity, gzip o br), 304
+# amb If-None-Match (comparació dèbil, RFC 9110 §13.1.2) i
+# una política de Cache-Control explícita per ruta. Totes les respostes amb
+# dades d'usuari són "private", que és el que necessita el workaround de Safari.
+
+CACHE_POLICIES = {
+    "/wrapped": "private, no-cache",
+    "/wrapped/image": "private, no-cache",
+    "/activities": "private, no-cache",
+    "/wrapped/stream": "private, no-store",
+    "/wrapped/story": "private, no-cache",
+    "/wrapped/jobs": "private, no-store",
+    "/clubs": "private, no-cache",
+    "/import/strava_export": "private, no-store",
+    "/me": "private, no-store",
+    "/me_token": "private, no-store",
+    "/auth": "no-store",
+    "/exchange_token": "no-store",
+    "/debug_tokens": "no-store",
+    "/debug/profiles": "no-store",
+    "/metrics": "no-store",
+    "/ready": "no-store",
+}
+DEFAULT_POLICY = "private, no-cache"
+# Les respostes privades depenen de qui les demana
+VARY_PRIVATE = "Cookie, X-Session-Token"
+
+
+def policy_for(path: str) -> str:
+    policy = CACHE_POLICIES.get(path)
+    if policy is not None:
+        return policy
+    # Rutes amb paràmetres (p.ex. /wrapped/jobs/{job_id}): el prefix més llarg
+    matches = [p for p in CACHE_POLICIES if path.startswith(p + "/")]
+    return CACHE_POLICIES[max(matches, key=len)] if matches else DEFAULT_POLICY
+
+
+def apply_cache_policy(path: str, response: Response):
+    """Set the route policy unless the endpoint already chose one."""
+    if "cache-control" not in response.headers:
+        response.headers["Cache-Control"] = policy_for(path)
+    if "private" in response.headers["cache-control"]:
+        vary = response.headers.get("vary")
+        response.headers["Vary"] = f"{vary}, {VARY_PRIVATE}" if vary else VARY_PRIVATE
+
+
+def content_hash(payload) -> str:
+    """Hash of the canonical JSON of the payload (also used as a disk cache key)."""
+    raw = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str).encode()
+    return hashlib.sha256(raw).hexdigest()[:32]
+
+
+def weak_etag(key: str) -> str:
+    return f'W/"{key}"'
+
+
+def compute_etag(payload) -> str:
+    """Weak ETag from the canonical JSON of the payload."""
+    return weak_etag(content_hash(payload))
+
+
+def _opaque_tag(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def not_modified(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = {_opaque_tag(tag) for tag in header.split(",")}
+    return "*" in candidates or _opaque_tag(etag) in candidates
+
+
+def not_modified_response(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag})
+
+
+def etag_json_response(request: Request, payload, etag: str = None) -> Response:
+    """JSON response with ETag, or an empty 304 when the client already has it."""
+    etag = etag or compute_etag(payload)
+    if not_modified(request, etag):
+        return not_modified_response(etag)
+    return JSONResponse(payload, headers={"ETag": etag})
@@ -0,0 +1,32 @@
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from src import config
+
+# Una sola requests.Session per procés: reutilitza connexions TLS amb Strava
+# en lloc d'obrir-ne una de nova a cada petició.
+
+_session = None
+_lock = threading.Lock()
+
+
+def get_http_session() -> requests.Session:
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=4, pool_maxsize=config.HTTP_POOL_SIZE
+                )
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+def warm_http_pool(url: str, timeout: float = 5):
+    """Open (and keep in the pool) a connection to the given host."""
+    get_http_session().head(url, timeout=timeout)
@@ -4,6 +4,16 @@ from pathlib import Path
 import time
 import base64
 import io
+import json
+import hashlib
+import threading
+from functools import lru_cache
+
+from src import config
+from src.metrics import RENDER_SECONDS, CACHE_HITS, CACHE_MISSES
+from src.logger import get_logger
+
+log = get_logger("image_generator")
 
 
 TEMPLATE_DIR = "assets/wrapped_cat/input"
@@ -96,7 +106,7 @@ TEMPLATES = {
             "secondary_sport": {"pos": (350, 1360), "size": 60, "color": TEXT_COLOR},
             "third_sport":  {"pos": (350, 1460), "size": 60, "color": TEXT_COLOR},
         }
-    }
+    },
 }
 
 FIELD_MAPPING = {
@@ -151,17 +161,37 @@ def resolve_field(field_name: str, stats: dict) -> str:
         raise ValueError(f"Field '{field_name}' not defined in FIELD_MAPPING")
     return resolver(stats)
 
+_template_cache = {}
+_template_lock = threading.Lock()
+
+def _load_template(template_name: str):
+    """Plantilla descodificada. Amb TEMPLATE_CACHE es descodifica només un cop per procés."""
+    if not config.TEMPLATE_CACHE:
+        return Image.open(TEMPLATES[template_name]["file"])
+    img = _template_cache.get(template_name)
+    if img is None:
+        with _template_lock:
+            img = _template_cache.get(template_name)
+            if img is None:
+                img = Image.open(TEMPLATES[template_name]["file"])
+                img.load()
+                _template_cache[template_name] = img
+    return img
+
+@lru_cache(maxsize=None)
 def load_font(size):
     try:
         return ImageFont.truetype(FONT_PATH, size)
     except IOError as e:
-        print(f"[FONT ERROR] {e}")
+        log.error("No s'ha pogut carregar la font: %s", e)
         return ImageFont.load_default()
 
-def render_template(template_name: str, stats: dict, output_path: str):
+def _draw_template(template_name: str, stats: dict):
+    """Obre la plantilla i hi dibuixa els camps. Retorna la imatge PIL (RGBA)."""
     template = TEMPLATES[template_name]
 
-    img = Image.open(template["file"]).convert("RGBA")
+    # convert() retorna una còpia, la plantilla en memòria no es toca
+    img = _load_template(template_name).convert("RGBA")
 
     if SCALE != 1:
         img = img.resize(
@@ -190,19 +220,64 @@ def render_template(template_name: str, stats: dict, output_path: str):
             font=font
         )
 
+    return img
+
+
+def render_template(template_name: str, stats: dict, output_path: str):
+    img = _draw_template(template_name, stats)
+    if output_path.endswith(".jpg"):
+        # Mateix JPEG que l'endpoint, així es pot servir directament
+        with open(output_path, "wb") as f:
+            f.write(_to_jpeg_bytes(img))
+        return
     img.save(output_path)
 
 
-def generate_wrapped_images_to_disk(stats: dict, athlete_id: int):  # Nom canviat
+def generate_wrapped_images_to_disk(stats: dict, athlete_id: int, fmt: str = "png"):  # Nom canviat
     output_dir = get_user_output_dir(athlete_id)
     outputs = []
-    for template_name in TEMPLATES:
-        output_path = output_dir / f"{template_name}.png"
+    templates = list(TEMPLATES)
+    for template_name in templates:
+        output_path = output_dir / f"{template_name}.{fmt}"
         render_template(template_name, stats, str(output_path))
         outputs.append(str(output_path))
+
+    # El manifest s'escriu l'últim (i atòmicament): si existeix, les imatges hi són totes
+    # cards_key: amb quines stats i plantilles s'han fet (si canvien, no es poden servir)
+    manifest = {"generated_at": time.time(), "format": fmt, "templates": templates,
+                "cards_key": cards_key(stats, athlete_id)}
+    tmp_path = output_dir / "manifest.json.tmp"
+    tmp_path.write_text(json.dumps(manifest))
+    os.replace(tmp_path, output_dir / "manifest.json")
     return outputs
 
 
+def cards_key(stats: dict, athlete_id) -> str:
+    """Clau de les targetes (stats + plantilles): cache de targetes a disc i ETag de /wrapped/image."""
+    from src.http_cache import content_hash
+    return content_hash({"stats": stats, "templates": templates_version(), "athlete_id": athlete_id})
+
+
+def load_prerendered_base64(athlete_id: int, key: str, max_age: int):
+    """
+    Targetes pre-renderitzades (JPEG) en Base64 si són prou recents i es van
+    fer amb les mateixes stats i plantilles (key = cards_key); si no, None.
+    """
+    output_dir = STORAGE_ROOT / "generated" / str(athlete_id) / "wrapped"
+    try:
+        manifest = json.loads((output_dir / "manifest.json").read_text())
+        if (manifest.get("format") != "jpg"
+                or manifest.get("cards_key") != key
+                or time.time() - manifest.get("generated_at", 0) > max_age):
+            return None
+        return [
+            base64.b64encode((output_dir / f"{name}.jpg").read_bytes()).decode("utf-8")
+            for name in manifest["templates"]
+        ]
+    except (OSError, ValueError):
+        return None
+
+
 def get_user_output_dir(athlete_id: int) -> Path:
     base = STORAGE_ROOT / "generated" / str(athlete_id) / "wrapped"
     base.mkdir(parents=True, exist_ok=True)
@@ -210,97 +285,120 @@ def get_user_output_dir(athlete_id: int) -> Path:
 
 def generate_wrapped_images_in_memory(stats: dict, athlete_id: int):
     """Genera les imatges del Wrapped i les retorna com a llista d'objectes PIL.Image."""
-    images_pil = []
-    
-    for template_name in TEMPLATES:
-        template = TEMPLATES[template_name]
-        # Obrir la plantilla (imatge de fons)
-        img = Image.open(template["file"]).convert("RGBA")
-
-        if SCALE != 1:
-            img = img.resize(
-                (img.width * SCALE, img.height * SCALE),
-                Image.Resampling.LANCZOS
-            )
-
-        draw = ImageDraw.Draw(img)
-
-        for field, cfg in template["fields"].items():
-            text = resolve_field(field, stats)
-            if not text:
-                continue
-
-            font = load_font(cfg["size"] * SCALE)
-            scaled_pos = (cfg["pos"][0] * SCALE, cfg["pos"][1] * SCALE)
-            draw.text(scaled_pos, text, fill=cfg["color"], font=font)
-
-        # Afegir l'objecte d'imatge a la llista (NO guardar a disc)
-        images_pil.append(img)
-    
-    return images_pil
+    # Afegir l'objecte d'imatge a la llista (NO guardar a disc)
+    return [_draw_template(template_name, stats) for template_name in TEMPLATES]
+
+def _to_jpeg_bytes(img) -> bytes:
+    """Converteix a JPEG (més eficient que PNG), amb fons blanc si té transparència."""
+    if img.mode in ('RGBA', 'LA', 'P'):
+        bg = Image.new('RGB', img.size, (255, 255, 255))
+        if img.mode == 'RGBA':
+            bg.paste(img, mask=img.split()[-1])
+        else:
+            bg.paste(img)
+        img.close()
+        img = bg
+
+    img_byte_arr = io.BytesIO()
+    img.save(img_byte_arr, format='JPEG', quality=85, optimize=True)
+    img.close()
+    return img_byte_arr.getvalue()
+
+def _card_cache_dir(athlete_id: int) -> Path:
+    return STORAGE_ROOT / "generated" / str(athlete_id) / "cards"
+
+def _cache_card(athlete_id: int, cache_key: str, template_name: str, data: bytes):
+    """Desa la targeta i esborra les d'altres versions (només es guarda l'última)."""
+    cache_dir = _card_cache_dir(athlete_id)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    tmp_path = cache_dir / f"{cache_key}_{template_name}.jpg.tmp"
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, cache_dir / f"{cache_key}_{template_name}.jpg")
+    for old in cache_dir.glob("*.jpg"):
+        if not old.name.startswith(f"{cache_key}_"):
+            old.unlink(missing_ok=True)
+
+def render_card_jpeg(template_name: str, stats: dict, athlete_id: int = None, cache_key: str = None) -> bytes:
+    """
+    Renderitza una sola targeta (JPEG). Amb cache_key (p.ex. l'ETag de les
+    stats + plantilles) es guarda a disc i es reaprofita a la següent petició.
+    """
+    use_cache = cache_key is not None and athlete_id is not None
+    if use_cache:
+        try:
+            data = (_card_cache_dir(athlete_id) / f"{cache_key}_{template_name}.jpg").read_bytes()
+            CACHE_HITS.inc(cache="card")
+            return data
+        except OSError:
+            CACHE_MISSES.inc(cache="card")
+
+    # 1. Obrir plantilla i renderitzar text
+    with RENDER_SECONDS.time(template=template_name, phase="draw"):
+        img = _draw_template(template_name, stats)
+
+    # 2. Convertir a JPEG
+    with RENDER_SECONDS.time(template=template_name, phase="encode"):
+        file_bytes = _to_jpeg_bytes(img)
+
+    if use_cache:
+        try:
+            _cache_card(athlete_id, cache_key, template_name, file_bytes)
+        except OSError as e:
+            log.warning("No s'ha pogut desar la targeta: %s", e, extra={"template": template_name})
+    return file_bytes
+
+def render_card_base64(template_name: str, stats: dict, athlete_id: int = None, cache_key: str = None) -> str:
+    """Renderitza una sola targeta i la retorna en Base64 (JPEG)."""
+    img_start = time.time()
+    file_bytes = render_card_jpeg(template_name, stats, athlete_id, cache_key)
+
+    # 3. Convertir a Base64
+    with RENDER_SECONDS.time(template=template_name, phase="base64"):
+        encoded_string = base64.b64encode(file_bytes).decode('utf-8')
 
-def generate_wrapped_images_base64(stats: dict, athlete_id: int):
+    img_elapsed = time.time() - img_start
+    log.debug("Targeta renderitzada", extra={"template": template_name, "size_kb": len(file_bytes) // 1024, "elapsed_s": round(img_elapsed, 3)})
+    return encoded_string
+
+def generate_wrapped_images_base64(stats: dict, athlete_id: int, cache_key: str = None):
     """
     Genera les imatges del Wrapped i les retorna com a llista de cadenes Base64 (JPEG).
     """
     start_total = time.time()
-    images_base64 = []
     
-    print(f"🖼️  [IMAGE_GEN] Iniciant generació per athlete {athlete_id}")
+    log.debug("Iniciant generació", extra={"athlete_id": athlete_id})
     
-    for i, template_name in enumerate(TEMPLATES.keys()):
-        img_start = time.time()
-        template = TEMPLATES[template_name]
-        
-        # 1. Obrir plantilla i renderitzar text
-        img = Image.open(template["file"]).convert("RGBA")
-        
-        if SCALE != 1:
-            img = img.resize(
-                (img.width * SCALE, img.height * SCALE),
-                Image.Resampling.LANCZOS
-            )
-
-        draw = ImageDraw.Draw(img)
-
-        for field, cfg in template["fields"].items():
-            text = resolve_field(field, stats)
-            if not text:
-                continue
-
-            font = load_font(cfg["size"] * SCALE)
-            scaled_pos = (cfg["pos"][0] * SCALE, cfg["pos"][1] * SCALE)
-            draw.text(scaled_pos, text, fill=cfg["color"], font=font)
-        
-        # 2. Convertir a JPEG (més eficient que PNG)
-        if img.mode in ('RGBA', 'LA', 'P'):
-            # Si té transparència, posar fons blanc
-            bg = Image.new('RGB', img.size, (255, 255, 255))
-            if img.mode == 'RGBA':
-                bg.paste(img, mask=img.split()[-1])
-            else:
-                bg.paste(img)
-            img = bg
-        
-        # Guardar com JPEG
-        img_byte_arr = io.BytesIO()
-        img.save(img_byte_arr, format='JPEG', quality=85, optimize=True)
-        img_byte_arr.seek(0)
-        
-        # 3. Convertir a Base64
-        file_bytes = img_byte_arr.read()
-        file_size_kb = len(file_bytes) // 1024
-        
-        encoded_string = base64.b64encode(file_bytes).decode('utf-8')
-        images_base64.append(encoded_string)
-        
-        # 4. Alliberar memòria
-        img.close()
-        
-        img_elapsed = time.time() - img_start
-        print(f"   🖼️  [IMAGE_GEN] {template_name}: {file_size_kb}KB en {img_elapsed:.1f}s")
+    images_base64 = [render_card_base64(template_name, stats, athlete_id, cache_key) for template_name in TEMPLATES]
     
     total_time = time.time() - start_total
-    print(f"✅ [IMAGE_GEN] {len(images_base64)} imatges generades en {total_time:.1f}s")
+    log.info("Imatges generades", extra={"athlete_id": athlete_id, "count": len(images_base64), "elapsed_s": round(total_time, 3)})
     
-    return images_base64
\ No newline at end of file
+    return images_base64
+
+_templates_version = None
+
+def templates_version() -> str:
+    """
+    Identificador de les plantilles (posicions, mides, fitxers). Les targetes són
+    funció de (stats, plantilles), així que serveix per fer l'ETag sense renderitzar.
+    """
+    global _templates_version
+    if _templates_version is None:
+        h = hashlib.sha256(json.dumps(TEMPLATES, sort_keys=True).encode())
+        h.update(f"{SCALE}|{FONT_PATH}".encode())
+        for template in TEMPLATES.values():
+            try:
+                st = os.stat(template["file"])
+                h.update(f"{st.st_size}:{st.st_mtime_ns}".encode())
+            except OSError:
+                pass
+        _templates_version = h.hexdigest()[:16]
+    return _templates_version
+
+def warm_up():
+    """Descodifica totes les plantilles i carrega les fonts que fan servir."""
+    for template_name, template in TEMPLATES.items():
+        if config.TEMPLATE_CACHE:
+            _load_template(template_name)
+        for cfg in template["fields"].values():
+            load_font(cfg["size"] * SCALE)
@@ -0,0 +1,104 @@
+import contextvars
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from src import config
+from src.state_store import get_store
+from src.metrics import ERRORS
+from src.logger import get_logger
+
+log = get_logger("jobs")
+
+# Jobs asíncrons per generar el Wrapped fora de la petició HTTP.
+# L'estat i els resultats van a l'store compartit, així qualsevol worker
+# pot respondre el polling encara que el job s'executi en un altre.
+
+JOB_PREFIX = "job:"
+INFLIGHT_PREFIX = "job_inflight:"
+
+_executor = ThreadPoolExecutor(
+    max_workers=config.JOB_WORKERS, thread_name_prefix="wrapped-job"
+)
+_pending = 0
+_pending_lock = threading.Lock()
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+def get_job(job_id: str) -> Optional[dict]:
+    return get_store().get(JOB_PREFIX + job_id)
+
+
+def _save_job(job: dict, ttl: int):
+    get_store().set(JOB_PREFIX + job["job_id"], job, ttl=ttl)
+
+
+def submit_wrapped_job(athlete_id: int) -> dict:
+    """
+    Enqueue a wrapped generation for the athlete and return the job.
+    If the athlete already has a job in flight, that job is returned instead.
+    """
+    global _pending
+    store = get_store()
+    inflight_key = f"{INFLIGHT_PREFIX}{athlete_id}"
+    job_id = secrets.token_urlsafe(16)
+
+    if not store.set_if_absent(inflight_key, job_id, ttl=config.JOB_TIMEOUT):
+        existing = get_job(store.get(inflight_key) or "")
+        if existing:
+            log.info("Job ja en curs", extra={"job_id": existing["job_id"], "athlete_id": athlete_id})
+            return existing
+        store.set(inflight_key, job_id, ttl=config.JOB_TIMEOUT)
+
+    with _pending_lock:
+        if _pending >= config.JOB_MAX_PENDING:
+            store.delete(inflight_key)
+            raise JobQueueFull()
+        _pending += 1
+
+    job = {
+        "job_id": job_id,
+        "athlete_id": athlete_id,
+        "status": "queued",
+        "created_at": time.time(),
+    }
+    _save_job(job, ttl=config.JOB_TIMEOUT + config.JOB_RESULT_TTL)
+    # Copiem el context perquè els logs del job portin el request_id de qui l'ha creat
+    _executor.submit(contextvars.copy_context().run, _run_wrapped_job, job)
+    log.info("Job encuat", extra={"job_id": job_id, "athlete_id": athlete_id})
+    return job
+
+
+def _run_wrapped_job(job: dict):
+    global _pending
+    # Import aquí per no carregar Pillow només per encuar
+    from src.strava_client import get_wrapped_stats
+    from src.image_generator import generate_wrapped_images_base64
+
+    athlete_id = job["athlete_id"]
+    try:
+        job["status"] = "running"
+        job["started_at"] = time.time()
+        _save_job(job, ttl=config.JOB_TIMEOUT + config.JOB_RESULT_TTL)
+
+        stats = get_wrapped_stats(athlete_id)
+        images = generate_wrapped_images_base64(stats, athlete_id)
+
+        job["status"] = "done"
+        job["result"] = {"athlete_id": athlete_id, "stats": stats, "images": images}
+    except Exception as e:
+        log.exception("Job ha fallat", extra={"job_id": job["job_id"], "athlete_id": athlete_id})
+        ERRORS.inc(stage="job")
+        job["status"] = "error"
+        job["error"] = str(e)
+    finally:
+        job["finished_at"] = time.time()
+        _save_job(job, ttl=config.JOB_RESULT_TTL)
+        get_store().delete(f"{INFLIGHT_PREFIX}{athlete_id}")
+        with _pending_lock:
+            _pending -= 1
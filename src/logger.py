@@ -0,0 +1,134 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import re
+import sys
+import time
+from contextvars import ContextVar
+
+from src import config
+
+# Logging estructurat. Els logs del fil de la petició només s'encuen
+# (QueueHandler); el format, la redacció i l'escriptura a stdout es fan
+# en un fil a part (QueueListener), així l'I/O no afegeix latència.
+
+request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
+
+REDACTED = "[REDACTED]"
+SENSITIVE_KEYS = {
+    "token", "access_token", "refresh_token", "session_token", "code",
+    "client_secret", "cookie", "authorization", "x-session-token",
+}
+_SENSITIVE_PATTERNS = [
+    re.compile(r"(?i)(bearer\s+)[A-Za-z0-9._~+/=-]+"),
+    re.compile(r"(?i)((?:access_token|refresh_token|token|code|client_secret|profile)=)[^&\s\"']+"),
+    re.compile(r"(?i)(workout_wrapped_session=)[^;\s\"']+"),
+]
+
+_STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "request_id"}
+
+
+def redact(text: str) -> str:
+    for pattern in _SENSITIVE_PATTERNS:
+        text = pattern.sub(lambda m: m.group(1) + REDACTED, text)
+    return text
+
+
+def _redact_value(key, value):
+    if key.lower() in SENSITIVE_KEYS:
+        return REDACTED
+    if isinstance(value, str):
+        return redact(value)
+    return value
+
+
+class RequestContextFilter(logging.Filter):
+    """Attach the request correlation id and sample DEBUG lines (runs on the caller thread)."""
+
+    def __init__(self, debug_sample_rate: float = 1.0):
+        super().__init__()
+        self.debug_sample_rate = debug_sample_rate
+
+    def filter(self, record):
+        if record.levelno <= logging.DEBUG and self.debug_sample_rate < 1.0:
+            if random.random() >= self.debug_sample_rate:
+                return False
+        record.request_id = request_id_var.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created))
+                  + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "msg": redact(record.getMessage()),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _STANDARD_ATTRS and not key.startswith("_"):
+                entry[key] = _redact_value(key, value)
+        if record.exc_text:
+            entry["exc"] = redact(record.exc_text)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s")
+
+    def format(self, record):
+        record.request_id = getattr(record, "request_id", "-")
+        line = super().format(record)
+        extras = " ".join(
+            f"{k}={_redact_value(k, v)}" for k, v in record.__dict__.items()
+            if k not in _STANDARD_ATTRS and not k.startswith("_") and k != "asctime"
+        )
+        return redact(f"{line} {extras}" if extras else line)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # No formatem al fil de la petició: només congelem el missatge.
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+_listener = None
+
+
+def setup_logging():
+    """Configure the 'wrapped' logger tree once per process."""
+    global _listener
+    if _listener is not None:
+        return
+
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JsonFormatter() if config.LOG_FORMAT == "json" else TextFormatter())
+
+    log_queue = queue.SimpleQueue()
+    handler = _QueueHandler(log_queue)
+    handler.addFilter(RequestContextFilter(config.LOG_DEBUG_SAMPLE_RATE))
+
+    root = logging.getLogger("wrapped")
+    root.setLevel(config.LOG_LEVEL)
+    root.addHandler(handler)
+    root.propagate = False
+
+    _listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=False)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+def get_logger(name: str) -> logging.Logger:
+    setup_logging()
+    return logging.getLogger(f"wrapped.{name}")
@@ -1,24 +1,48 @@
+import time
+_IMPORT_START = time.perf_counter()
+
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import RedirectResponse, FileResponse
+from fastapi.responses import RedirectResponse, FileResponse, JSONResponse, StreamingResponse, PlainTextResponse
+from starlette.concurrency import run_in_threadpool
 from starlette.middleware.sessions import SessionMiddleware
-import requests
-from datetime import datetime
-import time
+import asyncio
+import json
 from urllib.parse import urlencode
-from src.strava_client import get_wrapped_stats
-from src.image_generator import generate_wrapped_images_base64
-from src.token_manager import get_valid_token, has_tokens
 from src.auth_helper import get_current_athlete_id
+from src.session_tokens import create_session_token, get_session, list_sessions
+from src.token_store import save_tokens
+from src.jobs import submit_wrapped_job, get_job, JobQueueFull
+from src import club_stats
+from src.metrics import render_metrics, CACHE_HITS, CACHE_MISSES
+from src.admission import FETCH_GATE, RENDER_GATE, Overloaded
+from src.compression import CompressionMiddleware
+from src import profiling
+from src.profiling import profiled
+from src.http_cache import (apply_cache_policy, compute_etag, etag_json_response, not_modified,
+                            not_modified_response, weak_etag)
+from src.logger import get_logger, request_id_var
+from src.warmup import STATE as WARMUP_STATE, start_background_warmup
 import src.config as config  
 import os
+import uuid
 from starlette.middleware.base import BaseHTTPMiddleware
-import secrets
-import json
-from typing import Dict
 
-SESSION_TOKENS: Dict[str, Dict] = {}  # {token: {"athlete_id": 123, "created_at": ...}}
-TOKEN_EXPIRY_HOURS = 24
+log = get_logger("main")
+
+# Mòduls pesats (Pillow, requests): no calen per servir /auth, així que es
+# carreguen al warmup en segon pla o a la primera petició que els necessiti.
+def _strava():
+    from src import strava_client
+    return strava_client
+
+def _images():
+    from src import image_generator
+    return image_generator
+
+def _http():
+    from src.http_client import get_http_session
+    return get_http_session()
 
 app = FastAPI()
 
@@ -42,20 +66,57 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(CompressionMiddleware, minimum_size=config.COMPRESSION_MIN_SIZE)
+
 class MobileFixMiddleware(BaseHTTPMiddleware):
     async def dispatch(self, request: Request, call_next):
         response = await call_next(request)
         
+        # Política de cache explícita per ruta (veure src/http_cache.py)
+        apply_cache_policy(request.url.path, response)
+        
         # Headers específics per a Safari mòbil
         user_agent = request.headers.get("user-agent", "").lower()
         if "safari" in user_agent and "chrome" not in user_agent:
             response.headers["P3P"] = 'CP="This is not a P3P policy!"'
-            response.headers["Cache-Control"] = "no-cache, private"
+            # Safari necessita "private"; les polítiques per ruta ja ho són, la resta com abans
+            cache_control = response.headers.get("cache-control", "")
+            if "private" not in cache_control and "no-store" not in cache_control:
+                response.headers["Cache-Control"] = "no-cache, private"
         
         return response
 
 # Registra el middleware
 app.add_middleware(MobileFixMiddleware)
+
+# Profiling sota demanda: si no està configurat, ni tan sols s'afegeix
+if profiling.ENABLED:
+    app.add_middleware(profiling.ProfilingMiddleware)
+
+class RequestIdMiddleware(BaseHTTPMiddleware):
+    """Assigna un id de correlació a cada petició (X-Request-ID) per als logs"""
+    async def dispatch(self, request: Request, call_next):
+        request_id = request.headers.get("x-request-id") or uuid.uuid4().hex[:16]
+        token = request_id_var.set(request_id)
+        try:
+            response = await call_next(request)
+        finally:
+            request_id_var.reset(token)
+        response.headers["X-Request-ID"] = request_id
+        if config.WORKER_PID_HEADER:
+            response.headers["X-Worker-PID"] = str(os.getpid())
+        return response
+
+app.add_middleware(RequestIdMiddleware)
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    # Rebuig ràpid: el client ho torna a provar més tard en lloc d'esperar en cua
+    return JSONResponse(
+        {"detail": "Server overloaded, retry later", "stage": exc.stage},
+        status_code=503,
+        headers={"Retry-After": str(exc.retry_after)},
+    )
 # Get request for the auth using http://localhost:8000/auth to authorize using strava api the tokens for the app
 @app.get("/auth")
 def auth():
@@ -66,13 +127,13 @@ def auth():
         "scope": "activity:read_all",
         "approval_prompt": "auto"
     }
-    url = "https://www.strava.com/oauth/authorize?" + urlencode(params)
+    url = f"{config.STRAVA_BASE_URL}/oauth/authorize?" + urlencode(params)
     return RedirectResponse(url)
 
 # Get request for the auth using http://localhost:8000/auth to get the tokens and returns the athlete info in json
 @app.get("/exchange_token")
 async def exchange_token(request: Request,code: str):
-    url = "https://www.strava.com/oauth/token"
+    url = f"{config.STRAVA_BASE_URL}/oauth/token"
 
     payload = {
         "client_id": config.STRAVA_CLIENT_ID,
@@ -81,18 +142,9 @@ async def exchange_token(request: Request,code: str):
         "grant_type": "authorization_code",
     }
 
-    r = requests.post(url, data=payload)
+    r = _http().post(url, data=payload, timeout=15)
     data = r.json()
 
-    # Import this here to avoid circular imports
-    from src.token_store import save_tokens
-
-    # Guardem els tokens nous
-    save_tokens({
-        "access_token": data.get("access_token"),
-        "refresh_token": data.get("refresh_token"),
-        "expires_at": data.get("expires_at")
-    })
     # Define the active user from Strava auth
     athlete = data.get("athlete")
     if not athlete:
@@ -100,22 +152,20 @@ async def exchange_token(request: Request,code: str):
 
     athlete_id = athlete["id"]
 
+    # Guardem els tokens nous (per athlete, a l'store compartit)
+    save_tokens({
+        "access_token": data.get("access_token"),
+        "refresh_token": data.get("refresh_token"),
+        "expires_at": data.get("expires_at")
+    }, athlete_id)
+
     request.session["athlete_id"] = athlete_id
     request.session["authenticated"] = True
 
-     # Genera un token de sessió segur
-    session_token = secrets.token_urlsafe(32)
-    
-    # Guarda el token en memòria (associat amb athlete_id)
-    SESSION_TOKENS[session_token] = {
-        "athlete_id": athlete_id,
-        "created_at": datetime.now().isoformat()
-    }
+    # Genera un token de sessió segur i el guarda a l'store (associat amb athlete_id)
+    session_token = create_session_token(athlete_id)
     
-    # Neteja tokens antics (opcional)
-    cleanup_old_tokens()
-    
-    print(f"✅ [AUTH] Token creat: {session_token[:10]}... per athlete {athlete_id}")
+    log.info("Token de sessió creat", extra={"athlete_id": athlete_id})
     
     # Redirigeix al frontend amb el token com a paràmetre
     frontend_url = f"{config.FRONTEND_URL}?token={session_token}"
@@ -126,57 +176,279 @@ async def exchange_token(request: Request,code: str):
 
 # Get request for the activities using http://localhost:8000/activities once the .env is with the proper acces_token
 @app.get("/activities")
-def get_activities():
+async def get_activities(request: Request, after: str = None, before: str = None,
+                         sport_type: str = None, page: int = 1, per_page: int = 30,
+                         fields: str = None, format: str = None):
+    """
+    Activitats paginades. after/before: epoch o data ISO (per defecte l'últim any);
+    sport_type i fields: llistes separades per comes (fields=* per a tots els camps,
+    per defecte tots menys el mapa); format=ndjson per rebre tot el conjunt filtrat
+    en streaming, sense paginar.
+    """
+    athlete_id = get_current_athlete_id(request)
+    from src import activities_query
 
-    access_token = get_valid_token()
+    try:
+        after_ts = activities_query.parse_time(after)
+        before_ts = activities_query.parse_time(before)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid after/before date")
+    if format not in (None, "json", "ndjson"):
+        raise HTTPException(status_code=400, detail="format must be json or ndjson")
 
-    headers = {"Authorization": f"Bearer {access_token}"}
+    sport_types = activities_query.parse_list(sport_type)
+    field_set = activities_query.parse_list(fields)
+    try:
+        if format == "ndjson":
+            result = await FETCH_GATE.run(activities_query.stream_activities, athlete_id,
+                                          after_ts, before_ts, sport_types, field_set)
+        else:
+            result = await FETCH_GATE.run(activities_query.query_activities, athlete_id, after_ts, before_ts,
+                                          sport_types, page, per_page, field_set)
+    except Overloaded:
+        raise
+    except Exception as e:
+        log.warning("Error consultant activitats: %s", e, extra={"athlete_id": athlete_id})
+        raise HTTPException(status_code=502, detail="Could not fetch activities from Strava")
 
-    url = "https://www.strava.com/api/v3/athlete/activities"
+    headers = {"X-Activities-Source": result["source"]}
+    if result["total"] is not None:
+        headers["X-Total-Count"] = str(result["total"])
 
-    r = requests.get(url, headers=headers)
-    return r.json()
+    if format == "ndjson":
+        return StreamingResponse(activities_query.iter_ndjson(result["items"]),
+                                 media_type="application/x-ndjson", headers=headers)
+    # El total també forma part de la resposta: un 304 no pot deixar X-Total-Count vell
+    etag = compute_etag({"items": result["items"], "total": result["total"]})
+    response = etag_json_response(request, result["items"], etag)
+    response.headers.update(headers)
+    return response
 
 @app.get("/wrapped")
-def get_wrapped():
-    return get_wrapped_stats()
+async def get_wrapped(request: Request):
+    athlete_id = get_current_athlete_id(request)
+    stats = await FETCH_GATE.run(_strava().get_wrapped_stats, athlete_id)
+    return etag_json_response(request, stats)
 
 
 @app.get("/wrapped/image")
 async def generate_wrapped_image_endpoint(request: Request):
     start_total = time.time()
     
-    # DEBUG: Mostrar headers per veure si el token arriba
-    token_header = request.headers.get("x-session-token")
-    print(f"🔍 [/wrapped/image] Token header: {token_header[:20] + '...' if token_header else 'None'}")
-    print(f"🔍 [/wrapped/image] Session: {request.session.get('athlete_id')}")
-    
-    try:
-        athlete_id = get_current_athlete_id(request)
-    except HTTPException as e:
-        print(f"🚨 [/wrapped/image] Error auth: {e.detail}")
-        raise
-    
-    print(f"⏱️  [TIMING] START /wrapped/image per athlete {athlete_id}")
+    athlete_id = get_current_athlete_id(request)
+    log.debug("START /wrapped/image", extra={"athlete_id": athlete_id})
     
     # 1. Estadístiques
     start_stats = time.time()
-    stats = get_wrapped_stats()
+    stats = await FETCH_GATE.run(_strava().get_wrapped_stats, athlete_id)
     stats_time = time.time() - start_stats
-    print(f"✅ [TIMING] Stats en {stats_time:.1f}s - {stats.get('activities_last_year', 'N/A')}")
+    log.debug("Stats calculades", extra={"elapsed_s": round(stats_time, 3), "activities": stats.get("activities_last_year", "N/A")})
+    
+    # Les targetes depenen només de (stats, plantilles): si el client ja les té, no cal ni llegir-les
+    cards_key = _images().cards_key(stats, athlete_id)
+    etag = weak_etag(cards_key)
+    if not_modified(request, etag):
+        CACHE_HITS.inc(cache="http_etag")
+        return not_modified_response(etag)
     
-    # 2. Imatges en Base64 directament (nova funció)
+    # 2. Targetes pre-renderitzades pel batch (python -m src.batch_render)
+    images_base64 = await run_in_threadpool(profiled(_images().load_prerendered_base64), athlete_id, cards_key,
+                                          config.PRERENDER_MAX_AGE)
+    if images_base64:
+        CACHE_HITS.inc(cache="prerendered")
+        log.info("/wrapped/image servit des del pre-render", extra={"athlete_id": athlete_id})
+        return JSONResponse({
+            "athlete_id": athlete_id,
+            "images": images_base64
+        }, headers={"ETag": etag})
+    CACHE_MISSES.inc(cache="prerendered")
+    
+    # 3. Imatges en Base64 directament (nova funció)
     start_images = time.time()
-    images_base64 = generate_wrapped_images_base64(stats, athlete_id)
+    images_base64 = await RENDER_GATE.run(_images().generate_wrapped_images_base64, stats, athlete_id, cards_key)
     images_time = time.time() - start_images
     
     total_time = time.time() - start_total
-    print(f"🎯 [TIMING] COMPLET en {total_time:.1f}s")
+    log.info("/wrapped/image completat", extra={"athlete_id": athlete_id, "stats_s": round(stats_time, 3), "images_s": round(images_time, 3), "elapsed_s": round(total_time, 3)})
     
-    return {
+    return JSONResponse({
         "athlete_id": athlete_id,
         "images": images_base64
-    }
+    }, headers={"ETag": etag})
+
+@app.get("/wrapped/story")
+async def export_wrapped_story(request: Request, format: str = "webp"):
+    """
+    Totes les targetes en una sola story animada (webp, gif o mp4).
+    Reaprofita les targetes ja renderitzades: després de /wrapped/image només cal codificar.
+    """
+    athlete_id = get_current_athlete_id(request)
+    from src import story_export
+
+    if format not in story_export.FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(story_export.FORMATS)}")
+    stats = await FETCH_GATE.run(_strava().get_wrapped_stats, athlete_id)
+
+    cards_key = _images().cards_key(stats, athlete_id)
+    etag = compute_etag({"cards": cards_key, "story": format})
+    if not_modified(request, etag):
+        CACHE_HITS.inc(cache="http_etag")
+        return not_modified_response(etag)
+
+    try:
+        path = await RENDER_GATE.run(story_export.export_story, stats, athlete_id, format, cards_key)
+    except story_export.StoryFormatUnavailable as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    return FileResponse(path, media_type=story_export.FORMATS[format], filename=f"wrapped.{format}",
+                        headers={"ETag": etag})
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.get("/wrapped/stream")
+async def stream_wrapped(request: Request):
+    """
+    Server-Sent Events: primer les estadístiques i després cada targeta
+    tan bon punt està renderitzada. Si el client es desconnecta, no es
+    renderitzen les targetes que queden.
+    """
+    athlete_id = get_current_athlete_id(request, allow_query_token=True)
+    images = _images()
+    total = len(images.TEMPLATES)
+
+    async def events():
+        try:
+            yield _sse("progress", {"stage": "stats", "done": 0, "total": total})
+            stats = await FETCH_GATE.run(_strava().get_wrapped_stats, athlete_id)
+            yield _sse("stats", stats)
+
+            cache_key = images.cards_key(stats, athlete_id)
+            for i, template_name in enumerate(images.TEMPLATES):
+                if await request.is_disconnected():
+                    log.info("Client desconnectat, cancel·lades %d targetes", total - i, extra={"athlete_id": athlete_id})
+                    return
+                image = await RENDER_GATE.run(images.render_card_base64, template_name, stats, athlete_id, cache_key)
+                yield _sse("card", {"index": i, "template": template_name, "image": image})
+                yield _sse("progress", {"stage": "cards", "done": i + 1, "total": total})
+
+            yield _sse("done", {"athlete_id": athlete_id, "total": total})
+        except Overloaded as e:
+            # Les capçaleres ja s'han enviat: ho comuniquem com a event
+            yield _sse("error", {"detail": "Server overloaded, retry later", "stage": e.stage, "retry_after": e.retry_after})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.post("/wrapped/jobs", status_code=202)
+def create_wrapped_job(request: Request):
+    """Encua la generació del Wrapped i retorna l'id del job (deduplicat per athlete)"""
+    athlete_id = get_current_athlete_id(request)
+    try:
+        job = submit_wrapped_job(athlete_id)
+    except JobQueueFull:
+        raise HTTPException(status_code=503, detail="Too many pending jobs",
+                            headers={"Retry-After": "30"})
+    return {"job_id": job["job_id"], "status": job["status"]}
+
+@app.get("/wrapped/jobs/{job_id}")
+async def get_wrapped_job(request: Request, job_id: str, wait: float = 0):
+    """
+    Estat del job. Amb ?wait=N fa long-polling fins a N segons (màx. 30)
+    esperant que acabi, per no haver de fer polling curt des del client.
+    """
+    athlete_id = get_current_athlete_id(request)
+    deadline = time.time() + min(max(wait, 0), 30)
+
+    while True:
+        job = get_job(job_id)
+        if not job or job["athlete_id"] != athlete_id:
+            raise HTTPException(status_code=404, detail="Job not found")
+        if job["status"] in ("done", "error") or time.time() >= deadline:
+            return job
+        await asyncio.sleep(0.5)
+
+@app.post("/import/strava_export")
+async def import_strava_export(request: Request):
+    """
+    Importa l'export del compte de Strava (multipart, camp "file": .zip amb activities.csv i GPX/FIT).
+    Després /wrapped i /wrapped/image surten de les activitats importades, sense API.
+    """
+    athlete_id = get_current_athlete_id(request)
+    from src import export_import
+
+    # Abans de llegir el cos: un export massa gran no s'arriba a desar a disc
+    content_length = request.headers.get("content-length")
+    if content_length is None or not content_length.isdigit():
+        raise HTTPException(status_code=411, detail="Content-Length required")
+    if int(content_length) > config.IMPORT_MAX_BYTES:
+        raise HTTPException(status_code=413, detail="Export too large")
+
+    form = await request.form(max_files=1, max_fields=10)
+    try:
+        upload = form.get("file")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=400, detail="Missing file")
+        # El zip es llegeix directament del fitxer temporal on Starlette ha desat la pujada
+        result = await RENDER_GATE.run(export_import.import_strava_export, athlete_id, upload.file)
+    except export_import.ExportImportError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        await form.close()
+    return {"athlete_id": athlete_id, **result}
+
+async def _club_for_member(club_id: str, athlete_id: int) -> dict:
+    try:
+        return await FETCH_GATE.run(club_stats.check_member, club_id, athlete_id)
+    except club_stats.NotClubMember:
+        raise HTTPException(status_code=404, detail="Club not found")
+    except Overloaded:
+        raise
+    except Exception as e:
+        log.warning("Error comprovant els clubs a Strava: %s", e, extra={"athlete_id": athlete_id})
+        raise HTTPException(status_code=502, detail="Could not check club membership on Strava")
+
+@app.post("/clubs/{club_id}/join")
+async def join_club(request: Request, club_id: str):
+    """Afegeix l'atleta autenticat al club (el crea si no existeix). Cal ser-ne membre a Strava."""
+    athlete_id = get_current_athlete_id(request)
+    try:
+        club = await FETCH_GATE.run(club_stats.join_club, club_id, athlete_id)
+    except club_stats.NotClubMember:
+        raise HTTPException(status_code=403, detail="Not a member of this Strava club")
+    except club_stats.ClubBusy:
+        raise HTTPException(status_code=503, detail="Club busy, retry later",
+                            headers={"Retry-After": str(config.ADMISSION_RETRY_AFTER)})
+    except Overloaded:
+        raise
+    except Exception as e:
+        log.warning("Error comprovant els clubs a Strava: %s", e, extra={"athlete_id": athlete_id})
+        raise HTTPException(status_code=502, detail="Could not check club membership on Strava")
+    return {"club_id": club_id, "name": club["name"], "members": len(club["members"])}
+
+@app.get("/clubs/{club_id}/wrapped")
+async def get_club_wrapped(request: Request, club_id: str):
+    athlete_id = get_current_athlete_id(request)
+    await _club_for_member(club_id, athlete_id)
+    stats = await FETCH_GATE.run(club_stats.get_club_wrapped_stats, club_id)
+    return etag_json_response(request, stats)
+
+@app.get("/clubs/{club_id}/wrapped/image")
+async def get_club_wrapped_image(request: Request, club_id: str):
+    """Les mateixes plantilles que el Wrapped individual, amb les xifres del club"""
+    athlete_id = get_current_athlete_id(request)
+    await _club_for_member(club_id, athlete_id)
+    stats = await FETCH_GATE.run(club_stats.get_club_wrapped_stats, club_id)
+
+    etag = compute_etag({"stats": stats, "templates": _images().templates_version(), "club_id": club_id})
+    if not_modified(request, etag):
+        CACHE_HITS.inc(cache="http_etag")
+        return not_modified_response(etag)
+
+    images_base64 = await RENDER_GATE.run(_images().generate_wrapped_images_base64, stats, athlete_id)
+    return JSONResponse({"club_id": club_id, "images": images_base64}, headers={"ETag": etag})
 
 @app.get("/me")
 def me(request: Request):
@@ -184,9 +456,9 @@ def me(request: Request):
     athlete_id = request.session.get("athlete_id")
     authenticated = request.session.get("authenticated", False)
     
-    print(f"🔍 [/me] athlete_id: {athlete_id}, authenticated: {authenticated}")
-    print(f"🔍 [/me] User-Agent: {request.headers.get('user-agent', 'No UA')}")
-    print(f"🔍 [/me] Cookies: {request.headers.get('cookie', 'No cookies')}")
+    log.debug("/me", extra={"athlete_id": athlete_id, "authenticated": authenticated,
+                            "user_agent": request.headers.get("user-agent", "No UA"),
+                            "has_cookies": "cookie" in request.headers})
     
     # SOLUCIÓ: No depèn de has_tokens(), només de la sessió
     return {
@@ -204,8 +476,8 @@ def me_token(request: Request):
     """
     # Opció A: Token via header (per a Safari mòbil)
     token = request.headers.get("x-session-token")
-    if token and token in SESSION_TOKENS:
-        athlete_data = SESSION_TOKENS[token]
+    athlete_data = get_session(token)
+    if athlete_data:
         return {
             "authenticated": True,
             "athlete_id": athlete_data["athlete_id"],
@@ -214,8 +486,8 @@ def me_token(request: Request):
     
     # Opció B: Token via query param (per a redirecció inicial)
     token_param = request.query_params.get("token")
-    if token_param and token_param in SESSION_TOKENS:
-        athlete_data = SESSION_TOKENS[token_param]
+    athlete_data = get_session(token_param)
+    if athlete_data:
         return {
             "authenticated": True,
             "athlete_id": athlete_data["athlete_id"],
@@ -232,34 +504,58 @@ def me_token(request: Request):
         }
     
     # Si cap mètode funciona
-    print(f"🔍 [/me_token] No autenticat. Token header: {bool(token)}, Token param: {bool(token_param)}, Session: {request.session.get('athlete_id')}")
+    log.info("/me_token no autenticat", extra={"has_token": bool(token), "has_token_param": bool(token_param)})
     return {
         "authenticated": False,
         "auth_method": "none"
     }
 
+@app.on_event("startup")
+def startup():
+    start_background_warmup(IMPORT_MAIN_S)
+    log.info("Arrencada", extra={"import_main_s": round(IMPORT_MAIN_S, 4)})
+
+@app.get("/ready")
+def ready():
+    """Readiness: 200 quan el warmup ha acabat, 503 mentre encara escalfa"""
+    status_code = 200 if WARMUP_STATE["ready"] else 503
+    return JSONResponse(WARMUP_STATE, status_code=status_code)
+
+@app.get("/metrics")
+def metrics():
+    """Mètriques per etapa en format text de Prometheus (per worker)"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 @app.get("/debug_tokens")
 def debug_tokens():
     """Endpoint de debug per veure tokens actius"""
+    sessions = list_sessions()
     return {
-        "total_tokens": len(SESSION_TOKENS),
-        "tokens": {k[:10] + "...": v for k, v in SESSION_TOKENS.items()}
+        "total_tokens": len(sessions),
+        "tokens": {k[:10] + "...": v for k, v in sessions.items()}
     }
 
-def cleanup_old_tokens():
-    """Elimina tokens antics per evitar que la memòria creixi infinitament"""
-    global SESSION_TOKENS
-    cutoff = datetime.now().timestamp() - (TOKEN_EXPIRY_HOURS * 3600)
-    
-    expired = []
-    for token, data in SESSION_TOKENS.items():
-        created = datetime.fromisoformat(data["created_at"]).timestamp()
-        if created < cutoff:
-            expired.append(token)
-    
-    for token in expired:
-        del SESSION_TOKENS[token]
-    
-    if expired:
-        print(f"🧹 [CLEANUP] Eliminats {len(expired)} tokens expirats")
+def _require_profile_secret(request: Request):
+    # Sense secret configurat els perfils no existeixen per a ningú
+    if not profiling.check_secret(request.headers.get("x-profile")):
+        raise HTTPException(status_code=404, detail="Not found")
+
+@app.get("/debug/profiles")
+def list_profiles(request: Request):
+    """Perfils desats (els més recents primer). Capçalera X-Profile amb el secret."""
+    _require_profile_secret(request)
+    return {"profiles": profiling.list_profiles()}
+
+@app.get("/debug/profiles/{profile_id}.{kind}")
+def download_profile(request: Request, profile_id: str, kind: str):
+    """
+    json: línia de temps de les etapes; pstats: `python -m pstats` o snakeviz;
+    folded: flamegraph.pl o speedscope.
+    """
+    _require_profile_secret(request)
+    path = profiling.profile_file(profile_id, kind)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type=profiling.FILE_KINDS[kind], filename=path.name)
 
+IMPORT_MAIN_S = time.perf_counter() - _IMPORT_START
@@ -0,0 +1,178 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from src.profiling import current_profile
+
+# Mètriques en memòria exposades a /metrics en format text de Prometheus.
+# Sense dependències: un lock per mètrica i un dict per combinació d'etiquetes,
+# prou barat per deixar-ho sempre activat. Cada worker té els seus valors.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_REGISTRY = []
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    body = ",".join(f'{k}="{str(v)}"' for k, v in pairs)
+    return "{" + body + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(labels.get(n, "") for n in self.labelnames)
+
+    def _render_samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._render_samples())
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _render_samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {v}" for k, v in items]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def _render_samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {v}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        idx = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [comptadors per bucket (+Inf al final), suma, total]
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][idx] += 1
+            state[1] += value
+            state[2] += 1
+
+    def observe_since(self, start: float, **labels):
+        """observe() del temps des de `start` (time.perf_counter()) quan les etiquetes se saben al final."""
+        elapsed = time.perf_counter() - start
+        self.observe(elapsed, **labels)
+        # Línia de temps de la petició, només si s'està perfilant (veure src/profiling.py)
+        profile = current_profile.get()
+        if profile is not None:
+            profile.record_stage(self.name, labels, start, elapsed)
+        return elapsed
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_since(start, **labels)
+
+    def _render_samples(self):
+        with self._lock:
+            items = [(k, (list(s[0]), s[1], s[2])) for k, s in self._values.items()]
+        lines = []
+        for key, (counts, total_sum, total_count) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                labels = _format_labels(self.labelnames, key, ("le", le))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {total_sum}")
+            lines.append(f"{self.name}_count{labels} {total_count}")
+        return lines
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in _REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- Mètriques del pipeline del Wrapped ---
+
+TOKEN_SECONDS = Histogram(
+    "wrapped_token_resolution_seconds",
+    "Time to resolve a valid Strava access token (including refresh).",
+)
+STRAVA_FETCH_SECONDS = Histogram(
+    "wrapped_strava_fetch_seconds",
+    "Time spent fetching activities from Strava.",
+    ["status"],
+)
+STRAVA_FETCH_PAGES = Histogram(
+    "wrapped_strava_fetch_pages",
+    "Pages requested to Strava per activities fetch.",
+    buckets=(1, 2, 3, 5, 10, 20),
+)
+AGGREGATION_SECONDS = Histogram(
+    "wrapped_aggregation_seconds",
+    "Time to aggregate activities into wrapped stats.",
+)
+RENDER_SECONDS = Histogram(
+    "wrapped_render_seconds",
+    "Per-template card render time by phase (draw, encode, base64).",
+    ["template", "phase"],
+)
+CACHE_HITS = Counter("wrapped_cache_hits_total", "Cache hits.", ["cache"])
+CACHE_MISSES = Counter("wrapped_cache_misses_total", "Cache misses.", ["cache"])
+RATE_LIMIT_DEFERRALS = Counter(
+    "wrapped_rate_limit_deferrals_total",
+    "Requests deferred or dropped because of a rate limit.",
+    ["source"],
+)
+ERRORS = Counter("wrapped_errors_total", "Errors by pipeline stage.", ["stage"])
@@ -0,0 +1,304 @@
+import cProfile
+import functools
+import hmac
+import json
+import os
+import pstats
+import random
+import secrets
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Optional
+
+from src import config
+
+# Profiling d'una petició concreta amb dades reals de producció. S'activa amb
+# el secret (capçalera X-Profile; mai a la URL, que acaba al log d'accés) o per
+# mostreig, i captura:
+#   - la línia de temps de les etapes (cada Histogram.time/observe_since del
+#     pipeline, l'espera a les portes d'admissió, el temps fins al primer byte
+#     i el total de la petició),
+#   - un cProfile de la petició -> .pstats,
+#   - un perfil estadístic en format "folded" -> flamegraph.
+# El mostreig cobreix els threads de les portes d'admissió que executen la
+# petició i el thread del bucle d'esdeveniments (middlewares, JSON, compressió,
+# enviament). El cProfile és un sol perfil alhora a tot el procés: a partir de
+# Python 3.12 cProfile va per sys.monitoring, que és global (un segon enable()
+# falla i l'actiu veu tots els threads); abans el hook és per thread i se
+# n'activa un a cada thread de la petició. El bucle és compartit, així que en
+# tots dos casos hi pot sortir feina d'altres peticions concurrents. El camp
+# "scope" de cada perfil diu què s'ha capturat.
+# Sense PROFILE_SECRET ni PROFILE_SAMPLE_RATE el middleware no s'instal·la i
+# l'únic cost és llegir un ContextVar buit a cada etapa.
+
+ENABLED = bool(config.PROFILE_SECRET) or config.PROFILE_SAMPLE_RATE > 0
+SKIP_PATHS = {"/metrics", "/ready"}
+PROFILES_PATH = "/debug/profiles"
+FILE_KINDS = {"json": "application/json", "pstats": "application/octet-stream", "folded": "text/plain"}
+
+current_profile: ContextVar[Optional["RequestProfile"]] = ContextVar("current_profile", default=None)
+
+# Python 3.12+: un cProfile actiu veu tots els threads i no en pot haver dos
+CPROFILE_PROCESS_WIDE = sys.version_info >= (3, 12)
+# Quin perfil té el cProfile: només un alhora a tot el procés
+_cprofile_lock = threading.Lock()
+
+
+class RequestProfile:
+    def __init__(self, method: str, path: str, reason: str):
+        self.profile_id = time.strftime("%Y%m%d-%H%M%S") + "-" + secrets.token_hex(4)
+        self.method = method
+        self.path = path
+        self.reason = reason
+        self.started = time.perf_counter()
+        self.started_at = time.time()
+        self.stages = []
+        self._stats = None
+        self._stacks = Counter()
+        self._threads = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler = None
+        self._profiler = None
+        self._owns_cprofile = False
+        self._loop_thread = None
+        self.scope = {"cprofile": None, "sampling": None}
+        if config.PROFILE_MODE in ("sampling", "both"):
+            self._sampler = threading.Thread(target=self._sample, name=f"profiler-{self.profile_id}", daemon=True)
+            self._sampler.start()
+
+    def record_stage(self, name: str, labels: dict, start: float, duration: float):
+        entry = {
+            "stage": name,
+            **labels,
+            "start_ms": round((start - self.started) * 1000, 2),
+            "duration_ms": round(duration * 1000, 2),
+            "thread": threading.current_thread().name,
+        }
+        with self._lock:
+            self.stages.append(entry)
+
+    def _add_stats(self, profiler: cProfile.Profile):
+        with self._lock:
+            # Abans de 3.12, un cProfile per thread de la petició, combinats aquí
+            if self._stats is None:
+                self._stats = pstats.Stats(profiler)
+            else:
+                self._stats.add(profiler)
+
+    @staticmethod
+    def _start_profiler() -> Optional[cProfile.Profile]:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            return None  # Una altra eina de profiling ja és activa (fora d'aquest mòdul)
+        return profiler
+
+    def run(self, fn, *args):
+        """Executa fn en aquest thread dins del perfil (cProfile i/o mostreig)."""
+        thread_id = threading.get_ident()
+        with self._lock:
+            self._threads.add(thread_id)
+        # Amb 3.12+ el cProfile de attach_loop ja veu aquest thread
+        per_thread = self._owns_cprofile and not CPROFILE_PROCESS_WIDE
+        profiler = self._start_profiler() if per_thread else None
+        try:
+            return fn(*args)
+        finally:
+            if profiler:
+                profiler.disable()
+                self._add_stats(profiler)
+            with self._lock:
+                self._threads.discard(thread_id)
+
+    def attach_loop(self):
+        """Des del middleware: comença el perfil al thread del bucle fins a detach_loop."""
+        self._loop_thread = threading.get_ident()
+        with self._lock:
+            self._threads.add(self._loop_thread)
+        if self._sampler is not None:
+            self.scope["sampling"] = "event loop (shared with concurrent requests) + this request's gate threads"
+        if config.PROFILE_MODE not in ("cprofile", "both"):
+            return
+        if not _cprofile_lock.acquire(blocking=False):
+            self.scope["cprofile"] = "skipped: another request was being profiled"
+            return
+        self._profiler = self._start_profiler()
+        if self._profiler is None:
+            _cprofile_lock.release()
+            self.scope["cprofile"] = "skipped: another profiling tool is active"
+            return
+        self._owns_cprofile = True
+        if CPROFILE_PROCESS_WIDE:
+            self.scope["cprofile"] = "process-wide: every thread while the request ran (may include concurrent requests)"
+        else:
+            self.scope["cprofile"] = "event loop (shared with concurrent requests) + this request's gate threads"
+
+    def detach_loop(self):
+        if self._profiler is not None:
+            self._profiler.disable()
+            self._owns_cprofile = False
+            _cprofile_lock.release()
+            self._add_stats(self._profiler)
+            self._profiler = None
+        with self._lock:
+            self._threads.discard(self._loop_thread)
+
+    def _sample(self):
+        interval = config.PROFILE_SAMPLE_INTERVAL_MS / 1000
+        while not self._stop.wait(interval):
+            with self._lock:
+                threads = list(self._threads)
+            if not threads:
+                continue
+            frames = sys._current_frames()
+            for thread_id in threads:
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                if stack:
+                    with self._lock:
+                        self._stacks[";".join(reversed(stack))] += 1
+
+    def finish(self, request_id: str = None, status: int = None) -> dict:
+        """Atura el mostreig i desa els fitxers a PROFILE_DIR. Retorna el resum."""
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        total_ms = round((time.perf_counter() - self.started) * 1000, 2)
+
+        out_dir = Path(config.PROFILE_DIR)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        files = ["json"]
+        with self._lock:
+            if self._stats is not None:
+                self._stats.dump_stats(out_dir / f"{self.profile_id}.pstats")
+                files.append("pstats")
+            if self._stacks:
+                (out_dir / f"{self.profile_id}.folded").write_text(
+                    "".join(f"{stack} {count}\n" for stack, count in self._stacks.most_common())
+                )
+                files.append("folded")
+            summary = {
+                "profile_id": self.profile_id,
+                "method": self.method,
+                "path": self.path,
+                "reason": self.reason,
+                "request_id": request_id,
+                "status": status,
+                "started_at": self.started_at,
+                "total_ms": total_ms,
+                "mode": config.PROFILE_MODE,
+                "scope": self.scope,
+                "stages": sorted(self.stages, key=lambda s: s["start_ms"]),
+                "files": files,
+            }
+        tmp_path = out_dir / f"{self.profile_id}.json.tmp"
+        tmp_path.write_text(json.dumps(summary, indent=1))
+        os.replace(tmp_path, out_dir / f"{self.profile_id}.json")
+        _prune(out_dir)
+        return summary
+
+
+def _prune(out_dir: Path):
+    summaries = sorted(out_dir.glob("*.json"), key=lambda p: p.stat().st_mtime, reverse=True)
+    for old in summaries[config.PROFILE_KEEP:]:
+        for kind in FILE_KINDS:
+            (out_dir / f"{old.stem}.{kind}").unlink(missing_ok=True)
+
+
+def check_secret(value: Optional[str]) -> bool:
+    return bool(config.PROFILE_SECRET) and value is not None and hmac.compare_digest(value, config.PROFILE_SECRET)
+
+
+def _profile_reason(scope) -> Optional[str]:
+    path = scope["path"]
+    if path in SKIP_PATHS or path.startswith(PROFILES_PATH):
+        return None
+    if config.PROFILE_SECRET:
+        header = dict(scope["headers"]).get(b"x-profile")
+        if header is not None and check_secret(header.decode("latin-1")):
+            return "requested"
+    if config.PROFILE_SAMPLE_RATE and random.random() < config.PROFILE_SAMPLE_RATE:
+        return "sampled"
+    return None
+
+
+def profiled(fn):
+    """fn tal qual, o embolcallada perquè s'executi dins del perfil de la petició actual."""
+    profile = current_profile.get()
+    if profile is None:
+        return fn
+    return functools.partial(profile.run, fn)
+
+
+def list_profiles() -> list:
+    out_dir = Path(config.PROFILE_DIR)
+    if not out_dir.exists():
+        return []
+    profiles = []
+    for path in sorted(out_dir.glob("*.json"), key=lambda p: p.stat().st_mtime, reverse=True):
+        try:
+            summary = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue
+        summary.pop("stages", None)
+        profiles.append(summary)
+    return profiles
+
+
+def profile_file(profile_id: str, kind: str) -> Optional[Path]:
+    if kind not in FILE_KINDS or not profile_id.replace("-", "").isalnum():
+        return None
+    path = Path(config.PROFILE_DIR) / f"{profile_id}.{kind}"
+    return path if path.exists() else None
+
+
+class ProfilingMiddleware:
+    """Middleware ASGI: només s'afegeix a l'app si ENABLED."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        reason = _profile_reason(scope) if scope["type"] == "http" else None
+        if reason is None:
+            await self.app(scope, receive, send)
+            return
+
+        from starlette.concurrency import run_in_threadpool
+        from src.logger import get_logger, request_id_var
+
+        profile = RequestProfile(scope["method"], scope["path"], reason)
+        status = None
+
+        async def send_with_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", profile.profile_id.encode())]
+                profile.record_stage("time_to_first_byte", {}, profile.started, time.perf_counter() - profile.started)
+            await send(message)
+
+        token = current_profile.set(profile)
+        profile.attach_loop()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            profile.detach_loop()
+            profile.record_stage("request", {}, profile.started, time.perf_counter() - profile.started)
+            current_profile.reset(token)
+            summary = await run_in_threadpool(profile.finish, request_id_var.get(), status)
+            get_logger("profiling").info(
+                "Petició perfilada",
+                extra={"profile_id": profile.profile_id, "path": profile.path, "reason": reason,
+                       "total_ms": summary["total_ms"], "stages": len(summary["stages"])},
+            )
@@ -0,0 +1,101 @@
+import threading
+import time
+
+from src import config
+from src.metrics import RATE_LIMIT_DEFERRALS
+
+# Pressupost de peticions a Strava (finestra de 15 minuts + diària), per procés.
+# Es comença amb els límits de config i s'ajusta amb les capçaleres
+# X-RateLimit-Limit / X-RateLimit-Usage de cada resposta, que són les bones.
+
+WINDOW_S = 15 * 60
+DAY_S = 24 * 3600
+
+
+class RateBudget:
+    def __init__(self, limit_15min: int, limit_day: int, max_wait: float = 0):
+        self.limit_15min = limit_15min
+        self.limit_day = limit_day
+        self.max_wait = max_wait  # segons que acquire() pot esperar per defecte
+        self._used_15min = 0
+        self._used_day = 0
+        self._window_ends = 0
+        self._day_ends = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _window_reset(now):
+        # Strava reinicia la finestra als minuts 0, 15, 30 i 45, i el dia a mitjanit UTC
+        return now - (now % WINDOW_S) + WINDOW_S
+
+    @staticmethod
+    def _day_reset(now):
+        return now - (now % DAY_S) + DAY_S
+
+    def _roll(self, now):
+        if now >= self._window_ends:
+            self._used_15min = 0
+            self._window_ends = self._window_reset(now)
+        if now >= self._day_ends:
+            self._used_day = 0
+            self._day_ends = self._day_reset(now)
+
+    def seconds_until_available(self, n: int = 1) -> float:
+        """0 if n requests fit now, else seconds until the limiting window resets."""
+        now = time.time()
+        with self._lock:
+            self._roll(now)
+            if self._used_day + n > self.limit_day:
+                return self._day_ends - now
+            if self._used_15min + n > self.limit_15min:
+                return self._window_ends - now
+            return 0
+
+    def acquire(self, n: int = 1, max_wait: float = None) -> bool:
+        """
+        Reserve n requests, waiting up to max_wait seconds for the window to reset.
+        Returns False (and counts a deferral) if they don't fit in time.
+        """
+        max_wait = self.max_wait if max_wait is None else max_wait
+        deadline = time.time() + max_wait
+        deferred = False
+        while True:
+            now = time.time()
+            with self._lock:
+                self._roll(now)
+                if (self._used_15min + n <= self.limit_15min
+                        and self._used_day + n <= self.limit_day):
+                    self._used_15min += n
+                    self._used_day += n
+                    return True
+                wait = (self._day_ends if self._used_day + n > self.limit_day else self._window_ends) - now
+            if not deferred:
+                RATE_LIMIT_DEFERRALS.inc(source="budget")
+                deferred = True
+            if now + wait > deadline:
+                return False
+            time.sleep(min(wait, 5))
+
+    def update_from_headers(self, headers):
+        """Sync with Strava's own view of the usage (X-RateLimit-* headers)."""
+        limit = headers.get("X-RateLimit-Limit")
+        usage = headers.get("X-RateLimit-Usage")
+        if not limit or not usage:
+            return
+        try:
+            limit_15min, limit_day = (int(x) for x in limit.split(",")[:2])
+            used_15min, used_day = (int(x) for x in usage.split(",")[:2])
+        except ValueError:
+            return
+        with self._lock:
+            self._roll(time.time())
+            self.limit_15min, self.limit_day = limit_15min, limit_day
+            self._used_15min = max(self._used_15min, used_15min)
+            self._used_day = max(self._used_day, used_day)
+
+
+STRAVA_BUDGET = RateBudget(
+    config.STRAVA_RATE_LIMIT_15MIN,
+    config.STRAVA_RATE_LIMIT_DAY,
+    max_wait=config.STRAVA_BUDGET_MAX_WAIT,
+)
@@ -0,0 +1,39 @@
+import secrets
+from datetime import datetime
+from typing import Optional
+
+from src import config
+from src.state_store import get_store
+
+# Tokens de sessió (per a Safari mòbil) guardats a l'store compartit.
+# L'expiració la fa el propi store amb TTL, ja no cal netejar-los a mà.
+
+PREFIX = "session_token:"
+
+
+def create_session_token(athlete_id: int) -> str:
+    """Create a new session token for the athlete and return it."""
+    session_token = secrets.token_urlsafe(32)
+    get_store().set(
+        PREFIX + session_token,
+        {"athlete_id": athlete_id, "created_at": datetime.now().isoformat()},
+        ttl=config.SESSION_TOKEN_TTL,
+    )
+    return session_token
+
+
+def get_session(token: Optional[str]) -> Optional[dict]:
+    """Return the session data for a token, or None if unknown/expired."""
+    if not token:
+        return None
+    return get_store().get(PREFIX + token)
+
+
+def list_sessions() -> dict:
+    store = get_store()
+    sessions = {}
+    for key in store.keys(PREFIX):
+        data = store.get(key)
+        if data is not None:
+            sessions[key[len(PREFIX):]] = data
+    return sessions
@@ -0,0 +1,113 @@
+import json
+import threading
+import time
+from typing import Iterator, Optional
+
+from src import config
+
+# Tot l'estat per usuari (tokens de sessió, tokens de Strava...) passa per aquí.
+# Amb STATE_BACKEND=memory funciona com abans (un sol procés); amb
+# STATE_BACKEND=redis qualsevol worker/instància pot servir qualsevol usuari.
+
+
+class MemoryStore:
+    """Process-local store. Only valid when running a single worker."""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def _alive(self, key):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at is not None and expires_at <= time.time():
+            del self._data[key]
+            return None
+        return value
+
+    def get(self, key: str):
+        with self._lock:
+            return self._alive(key)
+
+    def get_many(self, keys) -> list:
+        with self._lock:
+            return [self._alive(k) for k in keys]
+
+    def set(self, key: str, value, ttl: Optional[int] = None):
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+
+    def set_if_absent(self, key: str, value, ttl: Optional[int] = None) -> bool:
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            if self._alive(key) is not None:
+                return False
+            self._data[key] = (value, expires_at)
+            return True
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def keys(self, prefix: str = "") -> Iterator[str]:
+        with self._lock:
+            candidates = [k for k in self._data if k.startswith(prefix)]
+            return iter([k for k in candidates if self._alive(k) is not None])
+
+
+class RedisStore:
+    """Shared store for multi-worker / multi-instance deployments."""
+
+    def __init__(self, url: str, namespace: str):
+        import redis  # Dependència opcional, només en mode redis
+
+        self._client = redis.Redis.from_url(url)
+        self._ns = namespace
+
+    def _key(self, key):
+        return f"{self._ns}{key}"
+
+    def get(self, key: str):
+        raw = self._client.get(self._key(key))
+        return json.loads(raw) if raw is not None else None
+
+    def get_many(self, keys) -> list:
+        keys = list(keys)
+        if not keys:
+            return []
+        raws = self._client.mget([self._key(k) for k in keys])
+        return [json.loads(raw) if raw is not None else None for raw in raws]
+
+    def set(self, key: str, value, ttl: Optional[int] = None):
+        self._client.set(self._key(key), json.dumps(value), ex=ttl)
+
+    def set_if_absent(self, key: str, value, ttl: Optional[int] = None) -> bool:
+        return bool(self._client.set(self._key(key), json.dumps(value), ex=ttl, nx=True))
+
+    def delete(self, key: str):
+        self._client.delete(self._key(key))
+
+    def keys(self, prefix: str = "") -> Iterator[str]:
+        start = len(self._ns)
+        for raw in self._client.scan_iter(match=self._key(prefix) + "*"):
+            yield raw.decode()[start:]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Return the configured store (created lazily, one per process)."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if config.STATE_BACKEND == "redis":
+                    _store = RedisStore(config.REDIS_URL, config.STATE_NAMESPACE)
+                else:
+                    _store = MemoryStore()
+    return _store
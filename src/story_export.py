@@ -0,0 +1,195 @@
+import hashlib
+import io
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from pathlib import Path
+
+from PIL import Image
+
+from src import config, image_generator
+from src.logger import get_logger
+from src.metrics import Histogram, CACHE_HITS, CACHE_MISSES
+
+# Story animada amb totes les targetes (i fosa entre elles) per compartir-la
+# d'un sol cop. Les targetes surten de la cache de render_card_jpeg (si l'usuari
+# ja les ha vist, només cal codificar), es reescalen a STORY_WIDTH tan bon punt
+# estan i els fotogrames es generen un a un: mai hi ha més de dues targetes a
+# mida completa en memòria. Amb ffmpeg tots els formats s'envien per una pipe a
+# mesura que es generen; sense, WebP/GIF els codifica Pillow, que els acumula
+# tots abans d'escriure (són pocs i ja reescalats: la memòria queda fitada) i
+# l'MP4 no està disponible. El resultat es guarda per clau de targetes, així
+# que una segona exportació és només llegir el fitxer.
+
+log = get_logger("story_export")
+
+FORMATS = {"webp": "image/webp", "gif": "image/gif", "mp4": "video/mp4"}
+
+STORY_SECONDS = Histogram(
+    "wrapped_story_export_seconds", "Time to build an animated story export.", ["format"]
+)
+
+
+# Arguments de sortida d'ffmpeg per format. El GIF fa una paleta per fotograma
+# (stats_mode=single) perquè ffmpeg tampoc els hagi d'acumular per calcular-la.
+FFMPEG_OUTPUT = {
+    "webp": ["-c:v", "libwebp_anim", "-quality", "80", "-loop", "0", "-f", "webp"],
+    "gif": ["-filter_complex", "split[a][b];[a]palettegen=stats_mode=single[p];[b][p]paletteuse=new=1",
+            "-loop", "0", "-f", "gif"],
+    "mp4": ["-c:v", "libx264", "-preset", "veryfast", "-pix_fmt", "yuv420p", "-movflags", "+faststart", "-f", "mp4"],
+}
+
+
+class StoryFormatUnavailable(Exception):
+    pass
+
+
+def ffmpeg_available() -> bool:
+    return shutil.which(config.FFMPEG_PATH) is not None
+
+
+def _fps(fmt: str) -> int:
+    return config.STORY_MP4_FPS if fmt == "mp4" else config.STORY_ANIM_FPS
+
+
+def _story_key(cache_key: str, fmt: str) -> str:
+    options = (f"{cache_key}|{fmt}|{config.STORY_WIDTH}|{config.STORY_HOLD_MS}|{config.STORY_TRANSITION_MS}"
+               f"|{config.STORY_TRANSITION_FRAMES}|{_fps(fmt)}")
+    return hashlib.sha256(options.encode()).hexdigest()[:32]
+
+
+def _story_dir(athlete_id: int) -> Path:
+    path = image_generator.STORAGE_ROOT / "generated" / str(athlete_id) / "story"
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def _story_size(width: int, height: int) -> tuple:
+    # Parells: yuv420p (MP4) no accepta mides senars
+    story_width = config.STORY_WIDTH - config.STORY_WIDTH % 2
+    story_height = round(height * story_width / width)
+    return story_width, story_height - story_height % 2
+
+
+def _cards(stats: dict, athlete_id: int, cache_key: str):
+    """Targetes ja reescalades, d'una en una a mesura que es renderitzen."""
+    size = None
+    for template_name in image_generator.TEMPLATES:
+        data = image_generator.render_card_jpeg(template_name, stats, athlete_id, cache_key)
+        with Image.open(io.BytesIO(data)) as card:
+            size = size or _story_size(card.width, card.height)
+            yield card.convert("RGB").resize(size, Image.Resampling.LANCZOS)
+
+
+def _frames(stats: dict, athlete_id: int, cache_key: str):
+    """(fotograma, durada en ms): cada targeta i, entre dues, la fosa."""
+    steps = config.STORY_TRANSITION_FRAMES
+    previous = None
+    for card in _cards(stats, athlete_id, cache_key):
+        if previous is not None and steps > 0:
+            for i in range(1, steps + 1):
+                yield Image.blend(previous, card, i / (steps + 1)), config.STORY_TRANSITION_MS // steps
+        yield card, config.STORY_HOLD_MS
+        previous = card
+
+
+def _write_frame(process: subprocess.Popen, raw: bytes, repeat: int):
+    # write() no té timeout: si ffmpeg s'encalla i no buida la pipe, el mata el temporitzador
+    stuck = threading.Event()
+
+    def kill():
+        stuck.set()
+        process.kill()
+
+    watchdog = threading.Timer(config.STORY_ENCODE_TIMEOUT, kill)
+    watchdog.start()
+    try:
+        for _ in range(repeat):
+            process.stdin.write(raw)
+    except BrokenPipeError:
+        if stuck.is_set():
+            raise subprocess.TimeoutExpired(process.args, config.STORY_ENCODE_TIMEOUT)
+        raise
+    finally:
+        watchdog.cancel()
+
+
+def _encode_ffmpeg(frames, fmt: str, output_path: Path):
+    fps = _fps(fmt)
+    process = None
+    # stderr a un fitxer: una pipe sense llegir pot omplir-se i bloquejar ffmpeg
+    with tempfile.TemporaryFile() as stderr:
+        try:
+            try:
+                for frame, duration_ms in frames:
+                    if process is None:
+                        process = subprocess.Popen(
+                            [config.FFMPEG_PATH, "-y", "-loglevel", "error",
+                             "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{frame.width}x{frame.height}",
+                             "-r", str(fps), "-i", "-", *FFMPEG_OUTPUT[fmt], str(output_path)],
+                            stdin=subprocess.PIPE, stderr=stderr, bufsize=0,
+                        )
+                    _write_frame(process, frame.tobytes(), max(1, round(duration_ms * fps / 1000)))
+            except BrokenPipeError:
+                pass  # ffmpeg ha sortit abans d'hora: el codi de sortida i l'stderr diuen per què
+            if process is None:
+                raise ValueError("No cards to encode")
+            process.stdin.close()
+            if process.wait(timeout=config.STORY_ENCODE_TIMEOUT) != 0:
+                stderr.seek(0)
+                raise RuntimeError(f"ffmpeg failed: {stderr.read(500).decode(errors='replace')}")
+        finally:
+            if process is not None and process.poll() is None:
+                process.kill()
+                process.wait()
+
+
+def _encode_pillow(frames, fmt: str, output_path: Path):
+    # Pillow vol tots els fotogrames alhora (WebP fa list() d'append_images)
+    images, durations = [], []
+    for frame, duration_ms in frames:
+        images.append(frame)
+        durations.append(duration_ms)
+    if not images:
+        raise ValueError("No cards to encode")
+    options = {"quality": 80, "method": 4} if fmt == "webp" else {"optimize": False, "disposal": 1}
+    images[0].save(
+        output_path, format=fmt.upper(), save_all=True, append_images=images[1:],
+        duration=durations, loop=0, **options,
+    )
+
+
+def export_story(stats: dict, athlete_id: int, fmt: str, cache_key: str) -> Path:
+    """Path del fitxer de la story (del cache si ja s'ha generat amb les mateixes targetes)."""
+    use_ffmpeg = ffmpeg_available()
+    if fmt == "mp4" and not use_ffmpeg:
+        raise StoryFormatUnavailable("mp4 export needs ffmpeg")
+
+    story_dir = _story_dir(athlete_id)
+    output_path = story_dir / f"{_story_key(cache_key, fmt)}.{fmt}"
+    if output_path.exists():
+        CACHE_HITS.inc(cache="story")
+        return output_path
+    CACHE_MISSES.inc(cache="story")
+
+    card_count = len(image_generator.TEMPLATES)
+    tmp_path = story_dir / f"{output_path.stem}.{os.getpid()}-{threading.get_ident()}.tmp"
+    try:
+        with STORY_SECONDS.time(format=fmt):
+            encode = _encode_ffmpeg if use_ffmpeg else _encode_pillow
+            encode(_frames(stats, athlete_id, cache_key), fmt, tmp_path)
+        os.replace(tmp_path, output_path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+    # Només es guarda la darrera versió de cada format
+    for old in story_dir.glob(f"*.{fmt}"):
+        if old != output_path:
+            old.unlink(missing_ok=True)
+    log.info("Story generada", extra={"athlete_id": athlete_id, "format": fmt, "cards": card_count,
+                                      "encoder": "ffmpeg" if use_ffmpeg else "pillow",
+                                      "size_kb": output_path.stat().st_size // 1024})
+    return output_path
@@ -1,71 +1,190 @@
 import requests
+import time
 from datetime import datetime, timedelta, timezone
 from collections import Counter
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
+from src import config
 from src.token_manager import get_valid_token
+from src.http_client import get_http_session
+from src.rate_budget import STRAVA_BUDGET
+from src import activity_cache, club_stats, enrichment
+from src.logger import get_logger
+from src.metrics import STRAVA_FETCH_SECONDS, STRAVA_FETCH_PAGES, AGGREGATION_SECONDS, RATE_LIMIT_DEFERRALS, ERRORS, CACHE_HITS, CACHE_MISSES
 
-BASE_URL = "https://www.strava.com/api/v3"
+BASE_URL = config.STRAVA_API_URL
+PER_PAGE = 200
 
-def get_activities_for_last_year():
-    """VERSIÓ SIMPLIFICADA: 1 sola petició, sense paral·lelització innecessària"""
-    print(f"🔍 [DEBUG] Iniciant get_activities_for_last_year()")
+log = get_logger("strava_client")
+
+def get_activities_for_last_year(athlete_id: int = None):
+    """
+    Activitats de l'últim any, paginant de PER_PAGE en PER_PAGE (normalment 1 sola petició).
+    None si no s'han pogut obtenir (token, pressupost, error de Strava): no és el mateix que [].
+    """
+    log.debug("Iniciant get_activities_for_last_year", extra={"athlete_id": athlete_id})
+    
+    cached = activity_cache.load_activities(athlete_id)
+    if cached is not None:
+        CACHE_HITS.inc(cache="activities")
+        if cached.get("source") == "export":
+            # Un export pot durar dies a la cache: la finestra de l'últim any es mou amb el temps
+            cutoff = (datetime.now(timezone.utc) - timedelta(days=365)).isoformat(timespec="seconds")
+            cutoff = cutoff.replace("+00:00", "Z")
+            return [a for a in cached["activities"] if a["start_date"] > cutoff]
+        return cached["activities"]
+    CACHE_MISSES.inc(cache="activities")
     
     try:
-        access_token = get_valid_token()
+        access_token = get_valid_token(athlete_id)
         if not access_token:
-            print("🚨 [DEBUG] Token buit")
-            return []
+            log.warning("Token buit", extra={"athlete_id": athlete_id})
+            return None
     except Exception as e:
-        print(f"🚨 [DEBUG] Error obtenint token: {e}")
-        return []
+        log.warning("Error obtenint token: %s", e, extra={"athlete_id": athlete_id})
+        ERRORS.inc(stage="token")
+        return None
     
     headers = {"Authorization": f"Bearer {access_token}"}
     
     # Últim any
     one_year_ago = int((datetime.now(timezone.utc) - timedelta(days=365)).timestamp())
     
-    # 1 SOLA PETICIÓ amb per_page=200 (més que suficient per 135 activitats)
-    url = f"{BASE_URL}/athlete/activities?page=1&per_page=200&after={one_year_ago}"
-    print(f"🔍 [DEBUG] URL: {url}")
-    
+    activities = []
+    pages = 0
+    start = time.perf_counter()
+    status = None
     try:
-        import time
-        start = time.time()
-        response = requests.get(url, headers=headers, timeout=15)
-        elapsed = time.time() - start
-        
-        print(f"📡 [DEBUG] Strava API respon en {elapsed:.1f}s - Status: {response.status_code}")
-        
-        if response.status_code != 200:
-            print(f"🚨 [DEBUG] Error {response.status_code}: {response.text[:200]}")
-            return []
+        # per_page=200 és el màxim de Strava: la majoria d'atletes caben en 1 pàgina
+        for page in range(1, config.STRAVA_MAX_PAGES + 1):
+            if not STRAVA_BUDGET.acquire():
+                log.warning("Pressupost de Strava esgotat", extra={"athlete_id": athlete_id, "page": page})
+                status = "budget"
+                ERRORS.inc(stage="strava_fetch")
+                return None
+            url = f"{BASE_URL}/athlete/activities?page={page}&per_page={PER_PAGE}&after={one_year_ago}"
+            log.debug("Petició a Strava", extra={"url": url})
+            response = get_http_session().get(url, headers=headers, timeout=15)
+            pages += 1
+            status = response.status_code
+            STRAVA_BUDGET.update_from_headers(response.headers)
+            
+            if response.status_code == 429:
+                RATE_LIMIT_DEFERRALS.inc(source="strava")
+            if response.status_code != 200:
+                log.warning("Error de Strava", extra={"status": response.status_code, "page": page, "body": response.text[:200]})
+                ERRORS.inc(stage="strava_fetch")
+                return None
+            
+            batch = response.json()
+            if not isinstance(batch, list):
+                log.warning("Resposta no és llista: %s", type(batch).__name__)
+                ERRORS.inc(stage="strava_fetch")
+                return None
+            
+            activities.extend(batch)
+            if len(batch) < PER_PAGE:
+                break
         
-        activities = response.json()
-        if not isinstance(activities, list):
-            print(f"🚨 [DEBUG] Resposta no és llista: {type(activities)}")
-            return []
-        
-        print(f"✅ [DEBUG] Obtingudes {len(activities)} activitats")
+        log.debug("Obtingudes %d activitats", len(activities))
+        if athlete_id is not None:
+            activity_cache.save_activities(athlete_id, activities, after=one_year_ago)
         return activities
         
     except requests.exceptions.Timeout:
-        print("⏰ [DEBUG] TIMEOUT")
-        return []
-    except Exception as e:
-        print(f"🚨 [DEBUG] Error: {e}")
-        return []
+        log.warning("Timeout a Strava", extra={"athlete_id": athlete_id})
+        status = "timeout"
+        ERRORS.inc(stage="strava_fetch")
+        return None
+    except Exception:
+        log.exception("Error obtenint activitats", extra={"athlete_id": athlete_id})
+        status = "error"
+        ERRORS.inc(stage="strava_fetch")
+        return None
+    finally:
+        elapsed = STRAVA_FETCH_SECONDS.observe_since(start, status=status)
+        STRAVA_FETCH_PAGES.observe(pages)
+        log.info("Strava API ha respost", extra={"status": status, "pages": pages, "elapsed_s": round(elapsed, 3)})
 
-def get_wrapped_stats():
+def get_activities_page(athlete_id: int, page: int = 1, per_page: int = 30, after: int = None, before: int = None):
+    """Una sola pàgina de /athlete/activities (per a rangs fora de l'últim any)"""
+    params = {"page": page, "per_page": per_page}
+    if after is not None:
+        params["after"] = after
+    if before is not None:
+        params["before"] = before
+
+    activities = _api_get(athlete_id, "/athlete/activities", params)
+    STRAVA_FETCH_PAGES.observe(1)
+    return activities
+
+def get_athlete_clubs(athlete_id: int):
+    """Clubs de Strava de l'atleta (GET /athlete/clubs, una pàgina de fins a PER_PAGE)"""
+    return _api_get(athlete_id, "/athlete/clubs", {"per_page": PER_PAGE})
+
+def _api_get(athlete_id: int, path: str, params: dict):
+    """GET a l'API amb el token de l'atleta, dins del pressupost de rate limit"""
+    headers = {"Authorization": f"Bearer {get_valid_token(athlete_id)}"}
+    if not STRAVA_BUDGET.acquire():
+        raise RuntimeError("Strava rate budget exhausted")
+    start = time.perf_counter()
+    try:
+        response = get_http_session().get(f"{BASE_URL}{path}", params=params, headers=headers, timeout=15)
+    except Exception:
+        STRAVA_FETCH_SECONDS.observe_since(start, status="error")
+        raise
+    STRAVA_FETCH_SECONDS.observe_since(start, status=response.status_code)
+    STRAVA_BUDGET.update_from_headers(response.headers)
+    if response.status_code == 429:
+        RATE_LIMIT_DEFERRALS.inc(source="strava")
+    response.raise_for_status()
+    return response.json()
+
+def get_wrapped_stats(athlete_id: int = None):
     """
     Versió OPTIMITZADA: Un sol pass per calcular totes les estadístiques
     i evita múltiples iteracions sobre la llista.
     """
-    activities = get_activities_for_last_year()
+    activities = get_activities_for_last_year(athlete_id)
     
     if not activities:
         return get_empty_stats()
     
+    with AGGREGATION_SECONDS.time():
+        summary = summarize_activities(activities)
+        stats = format_wrapped_stats(summary)
+
+    # El resum alimenta els Wrapped dels clubs de l'atleta (sense tornar a demanar res)
+    if athlete_id is not None:
+        try:
+            club_stats.save_member_summary(athlete_id, summary)
+        except Exception:
+            log.exception("Error actualitzant clubs", extra={"athlete_id": athlete_id})
+            ERRORS.inc(stage="clubs")
+    
+    # Targetes que necessiten el detall de les activitats (ENRICHED_CARDS)
+    if enrichment.enabled_cards():
+        try:
+            stats.update(enrichment.enrich_wrapped_stats(activities, get_valid_token(athlete_id)))
+        except Exception:
+            log.exception("Error enriquint activitats", extra={"athlete_id": athlete_id})
+            ERRORS.inc(stage="enrichment")
+
+    # Targetes a partir dels streams: NumPy només es carrega si estan activades
+    if {"power_curve", "hr_zones"}.intersection(config.ENRICHED_CARDS):
+        try:
+            from src import stream_stats
+            stats.update(stream_stats.stream_wrapped_stats(athlete_id, activities, get_valid_token(athlete_id)))
+        except Exception:
+            log.exception("Error calculant streams", extra={"athlete_id": athlete_id})
+            ERRORS.inc(stage="streams")
+    return stats
+
+def summarize_activities(activities):
+    """
+    Resum numèric i combinable (veure merge_summaries) de les activitats: les
+    estadístiques del Wrapped es deriven d'aquí amb format_wrapped_stats.
+    """
     # Inicialitza totes les variables en una sola passada
     stats = {
         'total_distance': 0,
@@ -79,8 +198,7 @@ def get_wrapped_stats():
         'total_prs': 0,
         'sports_counter': Counter(),
         'hour_counter': Counter(),
-        'max_kudos': 0,
-        'most_kudos_activity': None,
+        'most_kudos_activity': {"name": None, "kudos": 0, "private": False},
         'total_activities': len(activities)
     }
     
@@ -104,9 +222,11 @@ def get_wrapped_stats():
         # Social
         kudos = a.get("kudos_count", 0)
         stats['total_kudos'] += kudos
-        if kudos > stats['max_kudos']:
-            stats['max_kudos'] = kudos
-            stats['most_kudos_activity'] = a
+        candidate = {"id": a.get("id"), "kudos": kudos}
+        if most_kudos_key(candidate) > most_kudos_key(stats['most_kudos_activity']):
+            # private: els clubs no n'han de mostrar el nom (només les públiques)
+            private = bool(a.get("private")) or a.get("visibility", "everyone") != "everyone"
+            stats['most_kudos_activity'] = {"id": a.get("id"), "name": a.get("name"), "kudos": kudos, "private": private}
         
         stats['total_photos'] += a.get("total_photo_count", 0)
         stats['total_comments'] += a.get("comment_count", 0)
@@ -132,23 +252,57 @@ def get_wrapped_stats():
             except:
                 pass
     
+    # Diccionaris normals: el resum es guarda a l'store en JSON
+    stats['sports_counter'] = dict(stats['sports_counter'])
+    stats['hour_counter'] = dict(stats['hour_counter'])
+    return stats
+
+SUMMARY_COUNTERS = ("sports_counter", "hour_counter")
+
+def most_kudos_key(activity):
+    """
+    Ordre de most_kudos_activity: més kudos i, amb empat, la més antiga (id més baix).
+    És un ordre total, així un agregat incremental i un de reconstruït trien la mateixa.
+    Sense id (cap activitat encara) qualsevol activitat amb kudos la supera.
+    """
+    return (activity["kudos"], -(activity.get("id") or 0))
+
+def merge_summaries(total, summary, sign=1):
+    """
+    Suma (sign=1) o resta (sign=-1) un resum a `total`, in place. Tot és additiu
+    excepte most_kudos_activity, que és un màxim i el gestiona qui combina.
+    """
+    for key, value in summary.items():
+        if key in SUMMARY_COUNTERS:
+            counter = total.setdefault(key, {})
+            for name, count in value.items():
+                counter[name] = counter.get(name, 0) + sign * count
+                if counter[name] <= 0:
+                    del counter[name]
+        elif isinstance(value, (int, float)):
+            total[key] = total.get(key, 0) + sign * value
+    return total
+
+def format_wrapped_stats(stats):
     # CÀLCULS FINALS
     total_distance_km = stats['total_distance'] / 1000
     total_time_minutes = stats['total_time'] / 60
     total_time_days = total_time_minutes / (60 * 24)
     total_energy_kwh = round(stats['total_watt_seconds'] / 3_600_000, 2)
+    sports_counter = Counter(stats['sports_counter'])
+    hour_counter = Counter(stats['hour_counter'])
     
     # Esport dominant
     dominant_sport = "Unknown"
     sport_podium_list = []
-    if stats['sports_counter']:
-        dominant_sport = stats['sports_counter'].most_common(1)[0][0]
-        sport_podium_list = stats['sports_counter'].most_common(3)
+    if sports_counter:
+        dominant_sport = sports_counter.most_common(1)[0][0]
+        sport_podium_list = sports_counter.most_common(3)
     
     # Temps preferit
     training_profile = "Matiner"
-    if stats['hour_counter']:
-        dominant_hour = stats['hour_counter'].most_common(1)[0][0]
+    if hour_counter:
+        dominant_hour = hour_counter.most_common(1)[0][0]
         mapping = {"morning": "Matiner", "afternoon": "De tardes", "night": "Nocturn"}
         training_profile = mapping.get(dominant_hour, "Matiner")
     
@@ -171,13 +325,13 @@ def get_wrapped_stats():
         "total_elevation_m": str(int(stats['total_elevation'])) + " m",
         "everest_equivalent": everest_equivalents(stats['total_elevation']),
         "dominant_sport": dominant_sport,
-        "sports_practiced": len(stats['sports_counter']),
+        "sports_practiced": len(sports_counter),
         "sport_podium": podium_data,
         "total_energy_kwh": str(total_energy_kwh) + " kWh",
         "house_power_days": str(round((total_energy_kwh/9), 1)) + " dies",
         "most_kudos_activity": {
-            "name": stats['most_kudos_activity'].get("name") if stats['most_kudos_activity'] else None,
-            "kudos": stats['most_kudos_activity'].get("kudos_count") if stats['most_kudos_activity'] else 0
+            "name": stats['most_kudos_activity']["name"],
+            "kudos": stats['most_kudos_activity']["kudos"]
         },
         "total_prs": stats['total_prs'],
         "total_kudos": stats['total_kudos'],
@@ -234,7 +388,7 @@ def distance_statistics(total_distance_km):
     elif total_distance_km >= 8000  and total_distance_km <= 14000:
         distance_comp = "Barcelona - Tòquio"
     else:
-        "Gairebé mitja volta al món."
+        distance_comp = "Gairebé mitja volta al món."
     return distance_comp
 
 def everest_equivalents(total_elevation_m, everest_height_m=8848):
@@ -0,0 +1,204 @@
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import requests
+
+from src import config
+from src.http_client import get_http_session
+from src.logger import get_logger
+from src.metrics import Histogram, CACHE_HITS, CACHE_MISSES, ERRORS, RATE_LIMIT_DEFERRALS
+from src.rate_budget import STRAVA_BUDGET
+
+# Estadístiques a partir dels streams de les activitats (watts, pulsacions, temps).
+# Cada activitat es guarda re-mostrejada a 1 Hz com un array uint16 de 2 files
+# (watts, pulsacions) a STORAGE_ROOT/streams/<athlete_id>/<activity_id>.npy i es
+# llegeix amb memory-map. La corba de potència (millor mitjana per durada) i el
+# temps per zona de pulsacions es calculen vectoritzats amb NumPy.
+
+log = get_logger("stream_stats")
+
+STREAM_CARDS = {"power_curve", "hr_zones"}
+MAX_SECONDS = 24 * 3600  # activitats més llargues es trunquen
+WATTS_ROW, HR_ROW = 0, 1
+
+STREAM_SECONDS = Histogram(
+    "wrapped_stream_stats_seconds", "Time to load streams and compute stream analytics.", ["phase"]
+)
+
+_executor = ThreadPoolExecutor(max_workers=config.ENRICH_WORKERS, thread_name_prefix="streams")
+_index_lock = threading.Lock()
+
+
+def enabled_cards() -> set:
+    return STREAM_CARDS.intersection(config.ENRICHED_CARDS)
+
+
+def _athlete_dir(athlete_id: int) -> Path:
+    from src.image_generator import STORAGE_ROOT
+    path = STORAGE_ROOT / "streams" / str(athlete_id)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def _read_index(athlete_dir: Path) -> dict:
+    try:
+        return json.loads((athlete_dir / "index.json").read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_index(athlete_dir: Path, index: dict):
+    tmp = athlete_dir / "index.json.tmp"
+    tmp.write_text(json.dumps(index))
+    tmp.replace(athlete_dir / "index.json")
+
+
+def to_1hz(time_s, watts=None, heartrate=None) -> np.ndarray:
+    """
+    Re-mostreja a 1 Hz: els forats (pauses, pèrdues de senyal) queden a 0, com fa
+    Strava a la corba de potència. Retorna un array uint16 de forma (2, segons).
+    """
+    t = np.asarray(time_s, dtype=np.int64)
+    keep = (t >= 0) & (t < MAX_SECONDS)
+    t = t[keep]
+    seconds = int(t.max()) + 1 if len(t) else 0
+    out = np.zeros((2, seconds), dtype=np.uint16)
+
+    def values(stream, upper):
+        # Els nulls del stream passen a NaN en convertir-lo i després a 0
+        n = len(keep)
+        raw = np.asarray(stream[:n], dtype=np.float64)
+        v = np.zeros(n, dtype=np.float64)
+        v[:len(raw)] = np.nan_to_num(raw, nan=0.0)
+        return np.clip(v[keep], 0, upper)
+
+    if watts is not None:
+        out[WATTS_ROW, t] = values(watts, 65535)
+    if heartrate is not None:
+        out[HR_ROW, t] = values(heartrate, 255)
+    return out
+
+
+def _fetch_streams(activity_id: int, access_token: str):
+    if not STRAVA_BUDGET.acquire():
+        return None
+    try:
+        response = get_http_session().get(
+            f"{config.STRAVA_API_URL}/activities/{activity_id}/streams",
+            params={"keys": "time,watts,heartrate", "key_by_type": "true"},
+            headers={"Authorization": f"Bearer {access_token}"},
+            timeout=15,
+        )
+    except requests.RequestException as e:
+        log.warning("Error obtenint streams: %s", e, extra={"activity_id": activity_id})
+        ERRORS.inc(stage="streams")
+        return None
+    STRAVA_BUDGET.update_from_headers(response.headers)
+    if response.status_code == 429:
+        RATE_LIMIT_DEFERRALS.inc(source="strava")
+    if response.status_code != 200:
+        ERRORS.inc(stage="streams")
+        return None
+    streams = response.json()
+
+    def data(key):
+        return streams[key]["data"] if key in streams else None
+
+    if data("time") is None:
+        return np.zeros((2, 0), dtype=np.uint16)
+    return to_1hz(data("time"), data("watts"), data("heartrate"))
+
+
+def load_streams(athlete_id: int, activities: list, access_token: str) -> list:
+    """
+    Memory-mapped 1 Hz arrays for the activities with power or heart rate.
+    Missing ones are fetched concurrently and stored on disk for next time.
+    """
+    athlete_dir = _athlete_dir(athlete_id)
+    with _index_lock:
+        index = _read_index(athlete_dir)
+
+    wanted = [a["id"] for a in activities
+              if a.get("device_watts") or a.get("has_heartrate") or a.get("weighted_average_watts")]
+    missing = [i for i in wanted if str(i) not in index]
+    CACHE_HITS.inc(len(wanted) - len(missing), cache="streams")
+    CACHE_MISSES.inc(len(missing), cache="streams")
+
+    if missing:
+        with STREAM_SECONDS.time(phase="fetch"):
+            fetched = list(_executor.map(lambda i: _fetch_streams(i, access_token), missing))
+        with _index_lock:
+            index = _read_index(athlete_dir)
+            for activity_id, arr in zip(missing, fetched):
+                if arr is None:
+                    continue
+                np.save(athlete_dir / f"{activity_id}.npy", arr)
+                index[str(activity_id)] = {"seconds": int(arr.shape[1])}
+            _write_index(athlete_dir, index)
+
+    arrays = []
+    for activity_id in wanted:
+        if str(activity_id) in index and index[str(activity_id)]["seconds"] > 0:
+            arrays.append(np.load(athlete_dir / f"{activity_id}.npy", mmap_mode="r"))
+    return arrays
+
+
+def best_average_power(watts: np.ndarray, durations) -> np.ndarray:
+    """
+    Millor potència mitjana per a cada durada: amb la suma acumulada, la mitjana
+    de totes les finestres de d segons és (c[d:] - c[:-d]) / d, i en traiem el màxim.
+    """
+    c = np.concatenate(([0], np.cumsum(watts, dtype=np.int64)))
+    best = np.zeros(len(durations), dtype=np.float64)
+    for k, d in enumerate(durations):
+        if d <= len(watts):
+            best[k] = (c[d:] - c[:-d]).max() / d
+    return best
+
+
+def time_in_hr_zones(hr: np.ndarray, edges) -> np.ndarray:
+    """Segons a cada zona (len(edges) + 1 zones); les mostres a 0 (sense dada) no compten."""
+    hr = hr[hr > 0]
+    return np.bincount(np.searchsorted(edges, hr, side="right"), minlength=len(edges) + 1)
+
+
+def _format_duration_label(seconds: int) -> str:
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}min"
+    return f"{seconds // 3600}h"
+
+
+def stream_wrapped_stats(athlete_id: int, activities: list, access_token: str) -> dict:
+    cards = enabled_cards()
+    # Els streams es desen per atleta (STORAGE_ROOT/streams/<id>): sense atleta, res
+    if not cards or athlete_id is None:
+        return {}
+    arrays = load_streams(athlete_id, activities, access_token)
+
+    with STREAM_SECONDS.time(phase="compute"):
+        stats = {}
+        if "power_curve" in cards:
+            durations = config.POWER_CURVE_DURATIONS
+            curve = np.zeros(len(durations), dtype=np.float64)
+            for arr in arrays:
+                watts = arr[WATTS_ROW]
+                if watts.any():
+                    np.maximum(curve, best_average_power(watts, durations), out=curve)
+            stats["power_curve"] = {
+                _format_duration_label(d): str(int(round(w))) + " W" for d, w in zip(durations, curve)
+            }
+
+        if "hr_zones" in cards:
+            edges = np.array([p * config.HR_MAX for p in config.HR_ZONE_PCTS])
+            zones = np.zeros(len(edges) + 1, dtype=np.int64)
+            for arr in arrays:
+                zones += time_in_hr_zones(arr[HR_ROW], edges)
+            stats["hr_zones"] = {
+                f"Z{i + 1}": str(round(seconds / 3600, 1)) + " h" for i, seconds in enumerate(zones)
+            }
+    return stats
@@ -1,10 +1,15 @@
 import time
-import requests
 from src.token_store import load_tokens, save_tokens
 from src import config
+from src.http_client import get_http_session
+from src.metrics import TOKEN_SECONDS, CACHE_HITS, CACHE_MISSES, ERRORS
 
-def get_valid_token():
-    tokens = load_tokens()
+def get_valid_token(athlete_id: int = None):
+    with TOKEN_SECONDS.time():
+        return _resolve_token(athlete_id)
+
+def _resolve_token(athlete_id: int = None):
+    tokens = load_tokens(athlete_id)
 
     if tokens is None:
         raise Exception("No hi ha tokens guardats. Primer fes /auth.")
@@ -15,7 +20,9 @@ def get_valid_token():
 
     # If the token has not expired then, we return the same token because it is valid
     if expires_at and expires_at > time.time():
+        CACHE_HITS.inc(cache="strava_token")
         return access_token
+    CACHE_MISSES.inc(cache="strava_token")
 
     # If it has expired then we refresh it by calling the /oauth
     payload = {
@@ -25,8 +32,10 @@ def get_valid_token():
         "refresh_token": refresh_token
     }
 
-    url = "https://www.strava.com/oauth/token"
-    r = requests.post(url, data=payload)
+    url = f"{config.STRAVA_BASE_URL}/oauth/token"
+    r = get_http_session().post(url, data=payload, timeout=15)
+    if r.status_code != 200:
+        ERRORS.inc(stage="token_refresh")
     new_tokens = r.json()
 
     # We save the new tokens
@@ -34,12 +43,12 @@ def get_valid_token():
         "access_token": new_tokens.get("access_token"),
         "refresh_token": new_tokens.get("refresh_token"),
         "expires_at": new_tokens.get("expires_at")
-    })
+    }, athlete_id)
 
     return new_tokens.get("access_token")
 
-def has_tokens():
-    tokens = load_tokens()
+def has_tokens(athlete_id: int = None):
+    tokens = load_tokens(athlete_id)
 
     if not tokens:
         return False
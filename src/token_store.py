@@ -1,16 +1,27 @@
 import json
 import os
 
+from src.state_store import get_store
+
 TOKEN_FILE = "token_data.json"
+PREFIX = "strava_tokens:"
 
-def save_tokens(data: dict):
-    """Save access_token, refresh_token and expires_at in a JSON."""
+def save_tokens(data: dict, athlete_id: int = None):
+    """
+    Save access_token, refresh_token and expires_at.
+    With an athlete_id they go to the shared store, else to the local JSON (single user).
+    """
+    if athlete_id is not None:
+        get_store().set(f"{PREFIX}{athlete_id}", data)
+        return
     with open(TOKEN_FILE, "w") as f:
         json.dump(data, f, indent=4)
 
 
-def load_tokens():
+def load_tokens(athlete_id: int = None):
     """Load the tokens if they exist, else return none."""
+    if athlete_id is not None:
+        return get_store().get(f"{PREFIX}{athlete_id}")
     if not os.path.exists(TOKEN_FILE):
         return None
     with open(TOKEN_FILE, "r") as f:
@@ -1,20 +1,22 @@
 # src/user_context.py
 
+from contextvars import ContextVar
 from typing import Optional
 
-# User context active (only for local / testing)
-_active_user: Optional[dict] = None
+# User context active. It is a ContextVar so each request / job sees its own
+# user instead of a process-wide global shared between requests.
+_active_user: ContextVar[Optional[dict]] = ContextVar("active_user", default=None)
 
 
 def set_active_user(athlete_id: int, access_token: str):
-    global _active_user
-    _active_user = {
+    _active_user.set({
         "athlete_id": athlete_id,
         "access_token": access_token
-    }
+    })
 
 
 def get_active_user() -> dict:
-    if not _active_user:
+    user = _active_user.get()
+    if not user:
         raise RuntimeError("No active user. Authenticate first.")
-    return _active_user
+    return user
@@ -0,0 +1,69 @@
+import importlib
+import threading
+import time
+
+from src import config
+from src.logger import get_logger
+
+# Fase d'arrencada: /auth es pot servir de seguida, i mentrestant en segon pla
+# s'importen els mòduls pesats (Pillow, requests), es descodifiquen les
+# plantilles, es carreguen les fonts i s'obre la connexió amb Strava.
+# /ready informa de l'estat perquè el balancejador esperi si cal.
+
+log = get_logger("warmup")
+
+STATE = {
+    "ready": False,
+    "started_at": None,
+    "finished_at": None,
+    "import_main_s": None,
+    "phases": {},
+    "errors": {},
+}
+_started = False
+_lock = threading.Lock()
+
+
+def _phase(name, fn):
+    start = time.perf_counter()
+    try:
+        fn()
+    except Exception as e:
+        # Un error de warmup no ha de tombar el servei, ho farà la primera petició
+        STATE["errors"][name] = str(e)
+        log.warning("Warmup '%s' ha fallat: %s", name, e)
+    STATE["phases"][name] = round(time.perf_counter() - start, 4)
+
+
+def _warm_templates():
+    importlib.import_module("src.image_generator").warm_up()
+
+
+def _warm_http_pool():
+    from src.http_client import warm_http_pool
+    warm_http_pool(config.STRAVA_BASE_URL)
+
+
+def run_warmup():
+    STATE["started_at"] = time.time()
+    _phase("import_strava_client", lambda: importlib.import_module("src.strava_client"))
+    _phase("import_image_generator", lambda: importlib.import_module("src.image_generator"))
+    _phase("templates_and_fonts", _warm_templates)
+    _phase("http_pool", _warm_http_pool)
+    STATE["finished_at"] = time.time()
+    STATE["ready"] = True
+    log.info("Warmup completat", extra={"phases": STATE["phases"]})
+
+
+def start_background_warmup(import_main_s: float = None):
+    """Start the warmup thread once. Without WARMUP_ENABLED the app is ready immediately."""
+    global _started
+    with _lock:
+        if _started:
+            return
+        _started = True
+    STATE["import_main_s"] = import_main_s
+    if not config.WARMUP_ENABLED:
+        STATE["ready"] = True
+        return
+    threading.Thread(target=run_warmup, name="warmup", daemon=True).start()
@@ -0,0 +1,18 @@
+import os
+import secrets
+
+import pytest
+
+# src.config s'avalua en importar-se: cal una SECRET_KEY i l'store en memòria
+os.environ.setdefault("SECRET_KEY", secrets.token_hex(32))
+os.environ.setdefault("STATE_BACKEND", "memory")
+
+
+@pytest.fixture
+def store(monkeypatch):
+    """Un MemoryStore buit per a cada prova."""
+    from src import state_store
+
+    fresh = state_store.MemoryStore()
+    monkeypatch.setattr(state_store, "_store", fresh)
+    return fresh
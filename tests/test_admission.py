@@ -0,0 +1,58 @@
+import asyncio
+import threading
+
+import pytest
+
+from src.admission import AdmissionGate, Overloaded
+
+
+def _gate(**kwargs):
+    options = {"concurrency": 1, "max_queue": 0, "queue_timeout": 1, "retry_after": 7}
+    return AdmissionGate("test", **{**options, **kwargs})
+
+
+def test_full_queue_is_rejected_with_retry_after():
+    gate = _gate()
+    release = threading.Event()
+
+    async def scenario():
+        busy = asyncio.ensure_future(gate.run(release.wait))
+        await asyncio.sleep(0.05)
+        try:
+            with pytest.raises(Overloaded) as exc:
+                await gate.run(lambda: None)
+        finally:
+            release.set()
+            await busy
+        return exc.value
+
+    rejected = asyncio.run(scenario())
+    assert rejected.stage == "test"
+    assert rejected.retry_after == 7
+
+
+def test_overloaded_answers_503_with_retry_after():
+    pytest.importorskip("fastapi")
+    from src.main import overloaded_handler
+
+    response = asyncio.run(overloaded_handler(None, Overloaded("test", 7)))
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "7"
+
+
+def test_permit_is_released_when_the_thread_finishes_after_a_cancel():
+    gate = _gate(max_queue=1)
+    release = threading.Event()
+
+    async def scenario():
+        task = asyncio.ensure_future(gate.run(release.wait))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        # El thread encara treballa: el permís continua ocupat
+        assert gate._semaphore.locked()
+        release.set()
+        return await asyncio.wait_for(gate.run(lambda: "ok"), 2)
+
+    assert asyncio.run(scenario()) == "ok"
@@ -0,0 +1,57 @@
+"""
+L'agregat d'un club mantingut amb deltes (save_member_summary) ha de ser
+idèntic al que surt de reconstruir-lo de zero (rebuild_aggregate), també
+quan hi ha empats al màxim de kudos.
+"""
+import random
+
+from src import club_stats
+from src.strava_client import summarize_activities
+
+CLUB_ID = "1"
+MEMBERS = list(range(1, 7))
+
+
+def _activities(rng, athlete_id):
+    # Kudos en un rang petit perquè hi hagi molts empats entre membres
+    return [{
+        "id": athlete_id * 1000 + n,
+        "name": f"{athlete_id}-{n}",
+        "distance": rng.randint(1_000, 50_000),
+        "moving_time": rng.randint(600, 7_200),
+        "kudos_count": rng.randint(0, 3),
+        "sport_type": rng.choice(["Ride", "Run", "Swim"]),
+        "start_date": f"2025-0{rng.randint(1, 9)}-1{rng.randint(0, 9)}T0{rng.randint(0, 9)}:00:00Z",
+    } for n in range(rng.randint(0, 5))]
+
+
+def _comparable(aggregate):
+    return {k: aggregate[k] for k in ("summary", "most_kudos_athlete", "members_with_stats")}
+
+
+def test_incremental_aggregate_matches_rebuild(store):
+    rng = random.Random(42)
+    store.set(f"{club_stats.CLUB_PREFIX}{CLUB_ID}", {"club_id": CLUB_ID, "name": "Club", "members": MEMBERS})
+    for athlete_id in MEMBERS:
+        store.set(f"{club_stats.ATHLETE_CLUBS_PREFIX}{athlete_id}", [CLUB_ID])
+        club_stats.save_member_summary(athlete_id, summarize_activities(_activities(rng, athlete_id)))
+    club_stats.rebuild_aggregate(CLUB_ID)
+
+    for _ in range(200):
+        athlete_id = rng.choice(MEMBERS)
+        club_stats.save_member_summary(athlete_id, summarize_activities(_activities(rng, athlete_id)))
+        incremental = club_stats.get_club_aggregate(CLUB_ID)
+        assert _comparable(incremental) == _comparable(club_stats.rebuild_aggregate(CLUB_ID))
+
+
+def test_kudos_tie_keeps_the_oldest_activity(store):
+    store.set(f"{club_stats.CLUB_PREFIX}{CLUB_ID}", {"club_id": CLUB_ID, "name": "Club", "members": [1, 2]})
+    for athlete_id in (1, 2):
+        store.set(f"{club_stats.ATHLETE_CLUBS_PREFIX}{athlete_id}", [CLUB_ID])
+    club_stats.save_member_summary(1, summarize_activities([{"id": 20, "name": "nova", "kudos_count": 5}]))
+    club_stats.rebuild_aggregate(CLUB_ID)
+    club_stats.save_member_summary(2, summarize_activities([{"id": 10, "name": "antiga", "kudos_count": 5}]))
+
+    aggregate = club_stats.get_club_aggregate(CLUB_ID)
+    assert aggregate["most_kudos_athlete"] == 2
+    assert aggregate["summary"]["most_kudos_activity"]["name"] == "antiga"
@@ -0,0 +1,71 @@
+import gzip
+import io
+import zipfile
+
+from src.export_import import _row_to_activity, parse_gpx, read_activities
+
+HEADER = ["Activity ID", "Activity Date", "Activity Name", "Activity Type", "Elapsed Time", "Distance",
+          "Filename", "Elapsed Time", "Moving Time", "Distance", "Elevation Gain", "Weighted Average Power", "Media"]
+
+GPX = """<?xml version="1.0"?>
+<gpx xmlns="http://www.topografix.com/GPX/1/1"><trk><trkseg>
+<trkpt lat="41.0000" lon="2.0000"><ele>100</ele><time>{day}T08:00:00Z</time></trkpt>
+<trkpt lat="41.0010" lon="2.0000"><ele>105</ele><time>{day}T08:00:20Z</time></trkpt>
+<trkpt lat="41.0020" lon="2.0000"><ele>103</ele><time>{day}T08:00:40Z</time></trkpt>
+<trkpt lat="41.0030" lon="2.0000"><ele>110</ele><time>{day}T08:10:00Z</time></trkpt>
+</trkseg></trk></gpx>"""
+
+
+def _columns(header):
+    return {name: i for i, name in enumerate(header)}, {n for n in header if header.count(n) > 1}
+
+
+def test_row_to_activity_uses_the_detailed_repeated_columns():
+    columns, repeated = _columns(HEADER)
+    row = ["123", "Jan 5, 2024, 7:31:02 AM", "Volta", "Virtual Ride", "3,700", "25.1",
+           "activities/123.fit.gz", "3700", "3600", "25100.5", "410", "210", "a.jpg|b.jpg"]
+    activity = _row_to_activity(row, columns, repeated)
+    assert activity["id"] == 123
+    assert activity["sport_type"] == "VirtualRide"
+    assert activity["start_date"] == "2024-01-05T07:31:02Z"
+    assert activity["distance"] == 25100.5
+    assert activity["moving_time"] == 3600
+    assert activity["elapsed_time"] == 3700
+    assert activity["total_elevation_gain"] == 410
+    assert activity["weighted_average_watts"] == 210
+    assert activity["total_photo_count"] == 2
+
+
+def test_row_to_activity_single_distance_is_in_km():
+    header = ["Activity ID", "Activity Date", "Activity Name", "Activity Type", "Distance", "Filename"]
+    activity = _row_to_activity(["1", "", "Cursa", "Run", "10.5", ""], *_columns(header))
+    assert activity["distance"] == 10500
+    assert activity["start_date"] is None
+    assert activity["moving_time"] is None
+    assert "weighted_average_watts" not in activity
+
+
+def test_parse_gpx():
+    fields = parse_gpx(io.BytesIO(GPX.format(day="2024-05-01").encode()))
+    assert 330 < fields["distance"] < 335  # 3 trams de ~111 m
+    assert fields["total_elevation_gain"] == 12
+    assert fields["moving_time"] == 40  # l'últim tram (9 min 20 s) és una pausa
+    assert fields["elapsed_time"] == 600
+    assert fields["start_date"] == "2024-05-01T08:00:00Z"
+
+
+def test_read_activities_completes_rows_with_their_gpx():
+    from datetime import date, timedelta
+    day = (date.today() - timedelta(days=30)).isoformat()
+    csv_text = ",".join(HEADER) + "\n" + "7,,Sense dades,Ride,,,activities/7.gpx.gz,,,,,,\n"
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zf:
+        zf.writestr("export_1/activities.csv", csv_text)
+        zf.writestr("export_1/activities/7.gpx.gz", gzip.compress(GPX.format(day=day).encode()))
+    archive.seek(0)
+
+    activities, stats = read_activities(archive)
+    assert stats == {"rows": 1, "invalid_rows": 0, "gpx_parsed": 1, "imported": 1}
+    assert activities[0]["start_date"] == f"{day}T08:00:00Z"
+    assert activities[0]["moving_time"] == 40
+    assert "_file" not in activities[0]
@@ -0,0 +1,29 @@
+import pytest
+
+pytest.importorskip("fastapi")
+from starlette.requests import Request
+
+from src.http_cache import compute_etag, not_modified, weak_etag
+
+
+def _request(if_none_match=None):
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+
+def test_compute_etag_is_weak_and_stable():
+    etag = compute_etag({"b": 1, "a": [1, 2]})
+    assert etag.startswith('W/"')
+    assert etag == compute_etag({"a": [1, 2], "b": 1})
+
+
+@pytest.mark.parametrize("header", [
+    'W/"abc"', '"abc"', '"zzz", W/"abc"', "*",
+])
+def test_if_none_match_uses_weak_comparison(header):
+    assert not_modified(_request(header), weak_etag("abc"))
+
+
+@pytest.mark.parametrize("header", [None, '"abd"', 'W/"zzz"'])
+def test_if_none_match_mismatch(header):
+    assert not not_modified(_request(header), weak_etag("abc"))
@@ -0,0 +1,134 @@
+"""
+Prova d'integració multi-worker: l'estat per usuari (tokens de sessió i de
+Strava) ha de ser visible des de qualsevol worker quan STATE_BACKEND=redis.
+
+Arrenca el servidor Strava fals i l'app amb `uvicorn --workers 2` contra el
+mateix Redis, fa el login (/exchange_token) i crida /wrapped/image fins que
+la serveix un worker diferent del que ha creat la sessió.
+
+Necessita uvicorn, requests, redis i un Redis accessible a REDIS_URL
+(per defecte redis://localhost:6379/0); si no hi són, la prova se salta.
+
+    python -m pytest -q tests/test_multiworker.py
+"""
+import os
+import secrets
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+requests = pytest.importorskip("requests")
+redis = pytest.importorskip("redis")
+pytest.importorskip("uvicorn")
+
+ROOT = Path(__file__).resolve().parent.parent
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+ATHLETE_ID = 4242
+START_TIMEOUT = 60
+MAX_ATTEMPTS = 50
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_until_up(url: str, process: subprocess.Popen):
+    deadline = time.time() + START_TIMEOUT
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url}: el procés ha acabat amb codi {process.returncode}")
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url}: no respon després de {START_TIMEOUT}s")
+
+
+def _uvicorn(app: str, port: int, env: dict, workers: int = 1) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", app, "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=ROOT, env=env,
+    )
+
+
+def _stop(process: subprocess.Popen):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+@pytest.fixture(scope="module")
+def redis_namespace():
+    try:
+        client = redis.Redis.from_url(REDIS_URL)
+        client.ping()
+    except redis.RedisError:
+        pytest.skip(f"Redis no accessible a {REDIS_URL}")
+    namespace = f"wrapped-test-{secrets.token_hex(4)}:"
+    yield namespace
+    for key in client.scan_iter(f"{namespace}*"):
+        client.delete(key)
+
+
+@pytest.fixture(scope="module")
+def servers(redis_namespace):
+    fake_port, app_port = _free_port(), _free_port()
+    env = {
+        **os.environ,
+        "FAKE_STRAVA_LATENCY_MS": "0",
+        "FAKE_STRAVA_JITTER_MS": "0",
+        "FAKE_STRAVA_ACTIVITIES": "40",
+    }
+    fake = _uvicorn("src.fake_strava:app", fake_port, env)
+    app_env = {
+        **env,
+        "STATE_BACKEND": "redis",
+        "REDIS_URL": REDIS_URL,
+        "STATE_NAMESPACE": redis_namespace,
+        "STRAVA_BASE_URL": f"http://127.0.0.1:{fake_port}",
+        "SECRET_KEY": secrets.token_hex(32),
+        "FRONTEND_URL": "http://frontend.test/",
+        "WORKER_PID_HEADER": "1",
+        "WARMUP_ENABLED": "0",
+    }
+    app = _uvicorn("src.main:app", app_port, app_env, workers=2)
+    try:
+        _wait_until_up(f"http://127.0.0.1:{fake_port}/oauth/authorize?redirect_uri=x", fake)
+        _wait_until_up(f"http://127.0.0.1:{app_port}/ready", app)
+        yield f"http://127.0.0.1:{app_port}"
+    finally:
+        _stop(app)
+        _stop(fake)
+
+
+def test_session_is_shared_between_workers(servers):
+    login = requests.get(f"{servers}/exchange_token", params={"code": f"fake-{ATHLETE_ID}"},
+                         allow_redirects=False, timeout=30)
+    assert login.status_code in (302, 307)
+    token = parse_qs(urlparse(login.headers["location"]).query)["token"][0]
+    login_pid = login.headers["x-worker-pid"]
+
+    served_by = set()
+    for _ in range(MAX_ATTEMPTS):
+        # Connexió nova a cada crida perquè el kernel la pugui repartir a l'altre worker
+        response = requests.get(f"{servers}/wrapped/image", headers={"X-Session-Token": token,
+                                                                     "Connection": "close"}, timeout=60)
+        assert response.status_code == 200, response.text
+        assert response.json()["athlete_id"] == ATHLETE_ID
+        assert response.json()["images"]
+        served_by.add(response.headers["x-worker-pid"])
+        if served_by - {login_pid}:
+            break
+
+    assert served_by - {login_pid}, f"Tots els /wrapped/image els ha servit el worker {login_pid}"
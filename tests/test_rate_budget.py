@@ -0,0 +1,49 @@
+from src import rate_budget
+from src.rate_budget import RateBudget
+
+
+def test_acquire_stops_at_the_15min_limit():
+    budget = RateBudget(limit_15min=3, limit_day=100)
+    assert all(budget.acquire() for _ in range(3))
+    assert not budget.acquire(max_wait=0)
+    assert budget.seconds_until_available() > 0
+
+
+def test_acquire_stops_at_the_daily_limit():
+    budget = RateBudget(limit_15min=100, limit_day=2)
+    assert budget.acquire(n=2)
+    assert not budget.acquire(max_wait=0)
+
+
+def test_window_reset_frees_the_budget(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(rate_budget.time, "time", lambda: now[0])
+    budget = RateBudget(limit_15min=1, limit_day=100)
+    assert budget.acquire()
+    assert not budget.acquire(max_wait=0)
+    now[0] += rate_budget.WINDOW_S
+    assert budget.acquire()
+
+
+def test_update_from_headers_takes_strava_limits_and_usage():
+    budget = RateBudget(limit_15min=100, limit_day=1000)
+    budget.update_from_headers({"X-RateLimit-Limit": "10,500", "X-RateLimit-Usage": "9,20"})
+    assert (budget.limit_15min, budget.limit_day) == (10, 500)
+    assert budget.acquire()
+    assert not budget.acquire(max_wait=0)
+
+
+def test_update_from_headers_never_lowers_local_usage():
+    budget = RateBudget(limit_15min=10, limit_day=1000)
+    for _ in range(5):
+        budget.acquire()
+    budget.update_from_headers({"X-RateLimit-Limit": "10,1000", "X-RateLimit-Usage": "1,1"})
+    assert budget.acquire(n=5)
+    assert not budget.acquire(max_wait=0)
+
+
+def test_update_from_headers_ignores_missing_or_bad_values():
+    budget = RateBudget(limit_15min=10, limit_day=1000)
+    budget.update_from_headers({})
+    budget.update_from_headers({"X-RateLimit-Limit": "a,b", "X-RateLimit-Usage": "1,1"})
+    assert (budget.limit_15min, budget.limit_day) == (10, 1000)
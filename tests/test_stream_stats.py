@@ -0,0 +1,28 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+from src.stream_stats import HR_ROW, WATTS_ROW, best_average_power, to_1hz
+
+
+def test_to_1hz_fills_gaps_with_zero_and_nulls_with_zero():
+    out = to_1hz([0, 1, 4], watts=[100, None, 300], heartrate=[120, 130, 140])
+    assert out.dtype == np.uint16
+    assert out[WATTS_ROW].tolist() == [100, 0, 0, 0, 300]
+    assert out[HR_ROW].tolist() == [120, 130, 0, 0, 140]
+
+
+def test_to_1hz_clips_and_handles_short_streams():
+    out = to_1hz([0, 1, 2], watts=[-5, 70000], heartrate=None)
+    assert out[WATTS_ROW].tolist() == [0, 65535, 0]
+    assert out[HR_ROW].tolist() == [0, 0, 0]
+
+
+def test_to_1hz_empty():
+    assert to_1hz([], watts=[]).shape == (2, 0)
+
+
+def test_best_average_power():
+    watts = np.array([100, 200, 300, 0, 400], dtype=np.uint16)
+    best = best_average_power(watts, [1, 2, 3, 5, 10])
+    # 3 s: la millor finestra és 300, 0, 400; 10 s no hi cap
+    assert best.tolist() == pytest.approx([400, 250, 700 / 3, 200, 0])